@@ -1,12 +1,24 @@
-import streamlit as st
-import requests
 import pandas as pd
-import plotly.express as px
+import streamlit as st
+
+from utils.agregacao import agrega, agrega_mensal, cubo_vendas, filtra_cubo
+from utils.carregamento import botao_atualizar, carrega_recorte, dados_atualizados
+from utils.graficos import barras_categorias, barras_estados, barras_vendedores, linha_mensal, mapa_estados, mostra_grafico
+from utils.instrumentacao import finaliza_rerun, inicia_rerun, painel_debug
+from utils.regioes import regioes
+from utils.tabela import tabela_paginada
 
 st.set_page_config(layout = 'wide') # Permite que os gráficos fiquem responsivos ao tamanho da tela
 # Após isso, vá ao menu hambúrguer, localizado no canto superior direito, clique em "Settings" 
 # e selecionamos a opção "Wide mode", na seção "Appearance", assim alteramos o formato do Streamlit para expansivo.
 
+inicia_rerun('Dashboard')   # Começa a medir os tempos de cada etapa deste rerun (veja utils/instrumentacao.py)
+
+# Com o copy-on-write do pandas, os dataframes derivados dividem a memória com os dados compartilhados até que alguém tente alterá-los
+pd.set_option('mode.copy_on_write', True)
+
+LINHAS_RODAPE = 1000    # Quantidade máxima de linhas que podem ser navegadas na tabela do final da página
+
 
 def formata_numero(valor, prefixo = ''):    # Função para formatar os números
     for unidade in ['', 'mil']:
@@ -21,11 +33,6 @@ def formata_numero(valor, prefixo = ''):    # Função para formatar os números
 # Title
 st.title('DASHBOARD DE VENDAS :shopping_trolley:')  # :shopping_trolley: é um emoji
 
-url = 'https://labdados.com/produtos'       # Url da API
-
-# Lista de regiões para o filtro
-regioes = ['Brasil', 'Centro-Oeste', 'Nordeste', 'Norte', 'Sudeste', 'Sul']
-
 ################ Esses filtros serão passados na url da API, para filtrar os dados antes de eles chegarem aqui no código
 
 # Criando um sidebar para os filtros
@@ -43,171 +50,107 @@ if todos_anos:      # Se o checkbox estiver marcado, a variável ano recebe uma
 else:
     ano = st.sidebar.slider('Ano', 2020, 2023) # Criando um slider para o filtro de ano com label, o valor mínimo e máximo
 
-query_string = {'regiao':regiao.lower(), 'ano':ano} # Criando um dicionário com os parâmetros da url armazenando a região e o ano
-
-# Requisição
-response = requests.get(url, params= query_string)  # Passando esses filtros para a requisição
-
+botao_atualizar()   # Botão para buscar os dados novamente na API, sem esperar o cache expirar
 
-################### Tratamento dos dados
-dados = pd.DataFrame.from_dict(response.json())     # Transformando o json em um dataframe
+# Requisição (com cache): a API só é consultada quando a combinação região/ano não está em cache ou o cache expirou
+# A coluna 'Data da Compra' já chega convertida para datetime e as colunas de texto como categorias
+# O recorte guarda só as posições das linhas da região/ano dentro dos dados compartilhados (veja utils/recorte.py)
+dados = carrega_recorte(regiao, ano)
 
-# Transformando a coluna 'Data da Compra' em datetime
-dados['Data da Compra'] = pd.to_datetime(dados['Data da Compra'], format = '%d/%m/%Y') 
+if dados_atualizados():     # Os dados foram recarregados (por esta ou por outra sessão) desde o último rerun
+    st.info('Os dados foram atualizados.')
+cubo = cubo_vendas(dados, (regiao, ano))   # Cubo de vendas do recorte de região/ano (explicado mais abaixo), calculado uma vez por recorte
 
 ######## Esses filtros são para filtrar os dados após eles chegarem aqui no código
 
-filtro_vendedores = st.sidebar.multiselect('Vendedores', dados['Vendedor'].unique()) # Criando um multiselect para o filtro de vendedores, passando como parametro os nomes de vendedores únicos
+filtro_vendedores = st.sidebar.multiselect('Vendedores', cubo['Vendedor'].unique()) # Criando um multiselect para o filtro de vendedores, passando como parametro os nomes de vendedores únicos (que estão no cubo)
 # filtro vendedores se torna uma lista de vendedores que foram selecionados
 
-if filtro_vendedores:       # Se tiver alguma opção marcada no filtro de vendedores, a variável dados recebe somente os dados que possuem o nome do vendedor selecionado
-    dados = dados[dados['Vendedor'].isin(filtro_vendedores)]    # isin() verifica se o valor está contido na lista
+# Se tiver alguma opção marcada no filtro de vendedores, a tabela do final da página mostra somente as linhas com o nome do vendedor selecionado
+# Os dados são compartilhados entre as sessões, então o recorte guarda só as posições das linhas em vez de copiá-las
+dados_rodape = dados.onde(dados.coluna('Vendedor').isin(filtro_vendedores)) if filtro_vendedores else dados    # isin() verifica se o valor está contido na lista
 
 
 
 ################### Tabelas criadas para especificar os tipos de insights
 
-######## Tabelas de receita ##########
-
-receita_estados = dados.groupby('Local da compra')[['Preço']].sum() # Nova tabela com a receita por estado
-
-# Como perdemos a informação de latitude e longitude, criaremos uma nova tabela com essas informações 
-# para cada um dos estados, e depois agruparemos esta tabela com a que tem a receita total.
+# Em vez de agrupar todas as vendas para cada tabela, montamos uma vez o cubo de vendas (soma e contagem do
+# 'Preço' por estado, mês, categoria e vendedor) para o recorte de região/ano escolhido, e cada tabela é
+# uma agregação desse cubo. O filtro de vendedores é aplicado direto no cubo, já que vendedor é uma das dimensões
+cubo = filtra_cubo(cubo, filtro_vendedores)
 
-# Removendo duplicatas do campo 'Local da compra' e selecionando apenas as colunas 'Local da compra', 'lat' e 'lon'
-# Depois, fazemos um merge com a tabela de "receita por estado", usando o campo 'Local da compra' como chave
-# Por fim, ordenamos a tabela pela receita, em ordem decrescente
-receita_estados_completa = dados.drop_duplicates(subset = 'Local da compra')[['Local da compra', 'lat', 'lon']].merge(receita_estados, left_on = 'Local da compra', right_index = True).sort_values('Preço', ascending = False) 
+estados_agregados = agrega(cubo, 'Local da compra')         # Receita (sum) e quantidade de vendas (count) por estado
+mensal = agrega_mensal(cubo)                                # Receita e quantidade de vendas por mês, com as colunas 'Ano' e 'Mês'
+categorias = agrega(cubo, 'Categoria do Produto')           # Receita e quantidade de vendas por categoria
 
-# Criando uma nova coluna com a receita mensal
-# O método set_index() transforma a coluna 'Data da Compra' em índice
-# O método groupby() agrupa os dados por mês e soma a receita
-# O método reset_index() transforma o índice em coluna novamente
-receita_mensal = dados.set_index('Data da Compra').groupby(pd.Grouper(freq='M'))['Preço'].sum().reset_index()
+######## Tabelas de receita ##########
 
-# Agora vamos construir duas colunas: uma com a informação do mês e outra com a informação do ano
-# Cria coluna "Ano" e chama dt.year que transforma a data somente com a informação do ano.
-receita_mensal['Ano'] = receita_mensal['Data da Compra'].dt.year    
+# Nova tabela com a receita por estado (indexada por 'Local da compra'), ordenada pela receita, em ordem decrescente
+# A latitude e longitude de cada estado vêm da tabela fixa de estados (utils/regioes.py), dentro da função do mapa
+receita_estados = estados_agregados[['sum']].rename(columns = {'sum': 'Preço'}).sort_values('Preço', ascending = False)
 
-# Cria coluna "Mês" e chama dt.month_name() que transforma a data somente com a informação do mês.
-receita_mensal['Mês'] = receita_mensal['Data da Compra'].dt.month_name()
+# Tabela com a receita mensal (colunas 'Data da Compra', 'Preço', 'Ano' e 'Mês')
+receita_mensal = mensal.drop(columns = 'count').rename(columns = {'sum': 'Preço'})
 
 # Ordenamos a tabela pela receita, em ordem decrescente
-receita_categorias = dados.groupby('Categoria do Produto')[['Preço']].sum().sort_values('Preço', ascending = False)
+receita_categorias = categorias[['sum']].rename(columns = {'sum': 'Preço'}).sort_values('Preço', ascending = False)
 
 
 ######## Tabelas de quantidade de vendas ##########
 
-vendas_estados = dados.groupby('Local da compra')[['Preço']].count()
-vendas_estados_completa = dados.drop_duplicates(subset = 'Local da compra')[['Local da compra', 'lat', 'lon']].merge(vendas_estados, left_on = 'Local da compra', right_index = True).sort_values('Preço', ascending = False) 
-vendas_estados_completa = vendas_estados_completa.rename(columns = {'Preço': 'Quantidade de Vendas'})
+vendas_estados = estados_agregados[['count']].rename(columns = {'count': 'Quantidade de Vendas'}).sort_values('Quantidade de Vendas', ascending = False)
 
-vendas_mensal = dados.set_index('Data da Compra').groupby(pd.Grouper(freq='M'))['Preço'].sum().reset_index()
-vendas_mensal['Ano'] = vendas_mensal['Data da Compra'].dt.year    
-vendas_mensal['Mês'] = vendas_mensal['Data da Compra'].dt.month_name()
-vendas_mensal = vendas_mensal.rename(columns = {'Preço': 'Quantidade de Vendas'})
+vendas_mensal = mensal.drop(columns = 'sum').rename(columns = {'count': 'Quantidade de Vendas'})
 
-vendas_categoria = dados.groupby('Categoria do Produto')[['Preço']].count().sort_values('Preço', ascending = False)
+vendas_categoria = categorias[['count']].rename(columns = {'count': 'Quantidade de Vendas'}).sort_values('Quantidade de Vendas', ascending = False)
 
 
 ######## Tabelas de vendedores ##########
-vendedores = pd.DataFrame(dados.groupby('Vendedor')['Preço'].agg(['sum', 'count'])) # agg permite agregar mais de uma função ao mesmo tempo (Soma e contagem)
-
-
-
-################### Criação dos gráficos ###################
-
-######## Gráficos de receita ########
-
-## Gráfico de mapa, com a receita por estado no formato de bolhas
-fig_mapa_receita = px.scatter_geo(receita_estados_completa,  
-                                   lat = 'lat',                             # Latitude
-                                   lon = 'lon',                             # Longitude
-                                   scope = 'south america',                 # Localização do mapa
-                                   size = 'Preço',                          # Tamanho da bolha baseado na receita
-                                   template = 'seaborn',                    # Template do gráfico
-                                   hover_name = 'Local da compra',          # Nome que aparece ao passar o mouse
-                                   hover_data = {'lat':False,'lon':False},  # Não mostra a latitude e longitude ao passar o mouse
-                                   title = 'Receita por Estado')            # Título do gráfico
-
-
-## Gráfico de linha, com a receita mensal
-fig_receita_mensal = px.line(receita_mensal,
-                                x = 'Mês',                                  # Eixo X
-                                y = 'Preço',                                # Eixo Y
-                                markers = True,                             # Mostra os pontos nos meses
-                                range_y = (0, receita_mensal.max()),        # Define o intervalo do eixo Y, começando em 0 e indo até o valor máximo da receita
-                                color='Ano',                                # Define que a cor será alterada com base na informação do ano
-                                line_dash = 'Ano',                          # Define que a linha será tracejada com base na informação do ano
-                                title = 'Receita mensal')                   # Título do gráfico
-# Alterando Título do eixo Y
-fig_receita_mensal.update_layout(yaxis_title = 'Receita')             
-
-
-## Gráfico de barras, com a receita por estado
-fig_receita_estados = px.bar(receita_estados_completa.head(),
-                                x = 'Local da compra',                      # Eixo X
-                                y = 'Preço',                                # Eixo Y
-                                text_auto = True,                           # Mostra o valor da receita acima de cada barra
-                                title = 'Top estados')                      # Título do gráfico
-# Alterando Título do eixo Y
-fig_receita_estados.update_layout(yaxis_title = 'Receita')        
-
-
-## Gráfico de barras, com a receita por categoria
-fig_receita_categorias = px.bar(receita_categorias,                         # Como a tabela só possui duas colunas, não precisamos definir o eixo X e y
-                                    text_auto = True,
-                                    title = 'Receita por categoria')
-# Alterando Título do eixo Y
-fig_receita_categorias.update_layout(yaxis_title = 'Receita')
-
-
-######## Gráficos de Vendas ########
-
-## Gráfico de mapa, com as vendas por estado no formato de bolhas
-fig_mapa_vendas = px.scatter_geo(vendas_estados_completa,  
-                                    lat = 'lat',                          
-                                    lon = 'lon',                              
-                                    scope = 'south america',                 
-                                    size = 'Quantidade de Vendas',             
-                                    template = 'seaborn',                       
-                                    hover_name = 'Local da compra',             
-                                    hover_data = {'lat':False,'lon':False},     
-                                    title = 'Qtd Vendas por Estado')            
-
-
-## Gráfico de linha, com a venda mensal
-fig_receita_mensal = px.line(vendas_mensal,
-                                x = 'Mês',                                
-                                y = 'Quantidade de Vendas',                         
-                                markers = True,                             
-                                range_y = (0, vendas_mensal.max()),       
-                                color='Ano',                               
-                                line_dash = 'Ano',                         
-                                title = 'Qtd de Vendas mensal')                 
-# Alterando Título do eixo Y
-fig_receita_mensal.update_layout(yaxis_title = 'Vendas')
-
-
-## Gráfico de barras, com o top 5 vendas por estado
-fig_vendas_estados = px.bar(vendas_estados_completa.head(),
-                                x = 'Local da compra',                     
-                                y = 'Quantidade de Vendas',                            
-                                text_auto = True,                           
-                                title = 'Top estados')                     
-# Alterando Título do eixo Y
-fig_vendas_estados.update_layout(yaxis_title = 'Vendas')
-
-
-## Gráfico de barras, com as vendas por categoria
-fig_vendas_categorias = px.bar(vendas_categoria,                        
-                                    text_auto = True,
-                                    title = 'Vendas por categoria')
-# Alterando Título do eixo Y
-fig_vendas_categorias.update_layout(yaxis_title = 'Vendas')
-
-
-############ Visualização no Streamlit
+vendedores = agrega(cubo, 'Vendedor')   # Soma e contagem por vendedor
+
+# Totais usados nas métricas
+receita_total = cubo['sum'].sum()
+quantidade_vendas = cubo['count'].sum()
+
+
+
+################### Visualização no Streamlit
+
+# Os gráficos são montados dentro da aba em que aparecem, pelas funções de utils/graficos.py
+# Cada gráfico fica em cache pelo conteúdo da tabela que ele desenha, então um rerun que não muda a tabela
+# (por exemplo, mexer no widget de outra aba) não monta o gráfico de novo, e o gráfico guardado já vai
+# enxuto para o navegador (só os campos desenhados, com os números arredondados)
+
+# Rankings dos vendedores, ordenados uma única vez: o Top N é só uma fatia do começo de cada um
+ranking_receita = vendedores['sum'].sort_values(ascending = False)
+ranking_vendas = vendedores['count'].sort_values(ascending = False)
+
+
+# O fragmento (streamlit >= 1.37) faz com que só a parte dos vendedores rode de novo quando a quantidade
+# de vendedores muda, sem executar o script inteiro
+@st.fragment
+def top_vendedores(ranking_receita, ranking_vendas, vendedores):
+    qtd_vendedores = st.number_input('Quantidade de vendedores', 2, 10, 5)  # (label, valor mínimo, valor máximo, valor padrão)
+
+    coluna1, coluna2 = st.columns(2)
+
+    with coluna1:
+        st.metric('Receita', formata_numero(receita_total), 'R$')
+
+        # O gráfico é criado aqui dentro para que ele seja atualizado de acordo com o input da quantidade de vendedores
+        fig_receita_vendedores = barras_vendedores(ranking_receita.head(qtd_vendedores),                       # Pegando somente os primeiros vendedores que mais venderam
+                                                    f'Top {qtd_vendedores} vendedores (receita)')              # Título do gráfico personalizado com base no input
+        mostra_grafico(fig_receita_vendedores)
+
+    with coluna2:
+        st.metric('Quantidade de Vendas', formata_numero(quantidade_vendas))
+
+        fig_vendas_vendedores = barras_vendedores(ranking_vendas.head(qtd_vendedores),
+                                                    f'Top {qtd_vendedores} vendedores (quantidade de vendas)')
+        mostra_grafico(fig_vendas_vendedores)
+
+    st.dataframe(vendedores)
+
 
 # criação das abas para separar os tipos de insights
 aba1, aba2, aba3 = st.tabs(['Receita', 'Quantidade de vendas', 'Vendedores'])
@@ -219,63 +162,57 @@ with aba1: # Receita
 
     # A cláusula with permite acessar as colunas e colocar elementos dentro delas
     with coluna1:
-        st.metric('Receita', formata_numero(dados['Preço'].sum()), 'R$')        # Gráfico de métricas individuais
-        st.plotly_chart(fig_mapa_receita, use_container_width = True)           # # o use_container_width = True faz com que o gráfico ocupe toda a largura da coluna
-        st.plotly_chart(fig_receita_estados, use_container_width = True)
+        st.metric('Receita', formata_numero(receita_total), 'R$')        # Gráfico de métricas individuais
 
-    with coluna2:
-        st.metric('Quantidade de Vendas', formata_numero(dados.shape[0]))       # Gráfico de métricas individuais
-        st.plotly_chart(fig_receita_mensal, use_container_width = True)         # o use_container_width = True faz com que o gráfico ocupe toda a largura da coluna
-        st.plotly_chart(fig_receita_categorias, use_container_width = True)
-    
+        fig_mapa_receita = mapa_estados(receita_estados, 'Preço', 'Receita por Estado')
+        mostra_grafico(fig_mapa_receita)
 
+        fig_receita_estados = barras_estados(receita_estados, 'Preço', 'Receita')
+        mostra_grafico(fig_receita_estados)
 
-with aba2: # Quantidade de vendas
-    coluna1, coluna2 = st.columns(2)
+    with coluna2:
+        st.metric('Quantidade de Vendas', formata_numero(quantidade_vendas))       # Gráfico de métricas individuais
 
-    with coluna1:
-        st.metric('Receita', formata_numero(dados['Preço'].sum()), 'R$')  
-        st.plotly_chart(fig_mapa_vendas, use_container_width = True)     
-        st.plotly_chart(fig_vendas_estados, use_container_width = True)
+        fig_receita_mensal = linha_mensal(receita_mensal, 'Preço', 'Receita mensal', 'Receita')
+        mostra_grafico(fig_receita_mensal)
 
-    with coluna2:
-        st.metric('Quantidade de Vendas', formata_numero(dados.shape[0]))    
-        st.plotly_chart(fig_receita_mensal, use_container_width = True)   
-        st.plotly_chart(fig_vendas_categorias, use_container_width = True)
+        fig_receita_categorias = barras_categorias(receita_categorias, 'Receita por categoria', 'Receita')
+        mostra_grafico(fig_receita_categorias)
     
-    #st.dataframe(vendas_estados_completa)
-    #st.dataframe(vendas_categoria)
 
-with aba3: # Vendedores
-    qtd_vendedores = st.number_input('Quantidade de vendedores', 2, 10, 5)  # (label, valor mínimo, valor máximo, valor padrão)
 
+with aba2: # Quantidade de vendas
     coluna1, coluna2 = st.columns(2)
 
     with coluna1:
-        st.metric('Receita', formata_numero(dados['Preço'].sum()), 'R$')
+        st.metric('Receita', formata_numero(receita_total), 'R$')  
 
-        # Estou criando o gráfico aqui dentro para que ele seja atualizado de acordo com o input da quantidade de vendedores    
-        fig_receita_vendedores = px.bar(vendedores[['sum']].sort_values('sum', ascending=False).head(qtd_vendedores),               # Pegando somente os 5 primeiros vendedores que mais venderam
-                                            x='sum',
-                                            y=vendedores[['sum']].sort_values(['sum'], ascending=False).head(qtd_vendedores).index, # Pegando o nome dos vendedores
-                                            text_auto=True,
-                                            title=f'Top {qtd_vendedores} vendedores (receita)')                                      # Título do gráfico personalizado com base no input
-        st.plotly_chart(fig_receita_vendedores, use_container_width=True)
+        fig_mapa_vendas = mapa_estados(vendas_estados, 'Quantidade de Vendas', 'Qtd Vendas por Estado')
+        mostra_grafico(fig_mapa_vendas)     
+
+        fig_vendas_estados = barras_estados(vendas_estados, 'Quantidade de Vendas', 'Vendas')
+        mostra_grafico(fig_vendas_estados)
 
     with coluna2:
-        st.metric('Quantidade de Vendas', formata_numero(dados.shape[0]))  
+        st.metric('Quantidade de Vendas', formata_numero(quantidade_vendas))    
 
-        fig_vendas_vendedores = px.bar(vendedores[['count']].sort_values('count', ascending=False).head(qtd_vendedores),               # Pegando somente os 5 primeiros vendedores que mais venderam
-                                            x='count',
-                                            y=vendedores[['count']].sort_values(['count'], ascending=False).head(qtd_vendedores).index, # Pegando o nome dos vendedores
-                                            text_auto=True,
-                                            title=f'Top {qtd_vendedores} vendedores (quantidade de vendas)')                                      # Título do gráfico personalizado com base no input
-        st.plotly_chart(fig_vendas_vendedores, use_container_width=True)   
+        fig_vendas_mensal = linha_mensal(vendas_mensal, 'Quantidade de Vendas', 'Qtd de Vendas mensal', 'Vendas')
+        mostra_grafico(fig_vendas_mensal)   
 
-    st.dataframe(vendedores)
+        fig_vendas_categorias = barras_categorias(vendas_categoria, 'Vendas por categoria', 'Vendas')
+        mostra_grafico(fig_vendas_categorias)
+    
+    #st.dataframe(vendas_estados)
+    #st.dataframe(vendas_categoria)
+
+with aba3: # Vendedores
+    top_vendedores(ranking_receita, ranking_vendas, vendedores)
 
 
-# Tabela dos dados
-st.dataframe(dados)
+# Tabela dos dados, paginada: só a página atual é enviada para o navegador, e no máximo LINHAS_RODAPE linhas podem ser navegadas
+tabela_paginada(dados_rodape, 'rodape', max_linhas = LINHAS_RODAPE)
 #st.dataframe(receita_estados)
 
+# Fim do rerun: registra os tempos medidos e mostra o painel de tempos, se ele estiver marcado na sidebar
+finaliza_rerun()
+painel_debug()
@@ -0,0 +1 @@
+# Gerador de dados sintéticos e medições de desempenho do Dashboard e da página "Dados brutos"
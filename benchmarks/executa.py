@@ -0,0 +1,160 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import utils.backends
+import utils.carregamento
+from benchmarks.gerador import gera_produtos, salva_json
+from utils.servidor_local import inicia_servidor
+
+# Mede o Dashboard e a página "Dados brutos" sem navegador, com o AppTest do Streamlit, usando dados sintéticos.
+# Para cada tamanho são medidos: o tempo da primeira execução (cache vazio), o tempo de cada interação
+# (rerun depois de mexer em um widget) e o pico de memória. Cada execução acrescenta uma linha json
+# no arquivo de resultados, para comparar as medições ao longo do tempo.
+#
+# Uso: python -m benchmarks.executa --linhas 10000 100000 1000000 --fonte http
+
+raiz = Path(__file__).resolve().parent.parent
+dashboard = str(raiz / 'Dashboard.py')
+dados_brutos = str(raiz / 'pages' / 'Dados brutos.py')
+
+# O AppTest confere se o script terminou em intervalos de 0,1s, então o tempo medido em volta de app.run() anda
+# em degraus de 100 ms. O tempo de cada execução vem do próprio script: o total que utils/instrumentacao.py
+# grava no log de métricas ao fim de cada rerun
+registro_metricas = os.environ.setdefault('PRODUTOS_LOG_METRICAS', os.path.join(tempfile.gettempdir(), 'produtos-benchmark-metricas.jsonl'))
+
+
+def _widget(elementos, rotulo):
+    return next(elemento for elemento in elementos if elemento.label == rotulo)
+
+
+# Interações medidas em cada página: (nome, função que mexe no widget)
+interacoes_dashboard = [
+    ('regiao', lambda app: _widget(app.sidebar.selectbox, 'Região').select('Sudeste')),
+    ('todos_anos', lambda app: _widget(app.sidebar.checkbox, 'Dados de todo o período').uncheck()),
+    ('ano', lambda app: _widget(app.sidebar.slider, 'Ano').set_value(2022)),
+    ('vendedores', lambda app: _widget(app.sidebar.multiselect, 'Vendedores').set_value(_widget(app.sidebar.multiselect, 'Vendedores').options[:2])),
+    ('qtd_vendedores', lambda app: _widget(app.number_input, 'Quantidade de vendedores').set_value(8)),
+    ('pagina_rodape', lambda app: app.number_input(key = 'rodape_pagina').set_value(2)),
+]
+
+interacoes_dados_brutos = [
+    ('produtos', lambda app: app.sidebar.multiselect[0].set_value(app.sidebar.multiselect[0].options[:3])),
+    ('preco', lambda app: app.sidebar.slider[0].set_value((100, 2000))),
+    ('ordenacao', lambda app: app.selectbox(key = 'dados_brutos_ordem').select('Preço')),
+    ('pagina', lambda app: app.number_input(key = 'dados_brutos_pagina').set_value(3)),
+    ('formato', lambda app: _widget(app.selectbox, 'Formato').select('Parquet')),
+    ('preparar_arquivo', lambda app: _widget(app.button, 'Preparar arquivo').click()),
+]
+
+
+def _executa(app):
+    posicao = os.path.getsize(registro_metricas) if os.path.exists(registro_metricas) else 0
+    inicio = time.perf_counter()
+    app.run()
+    duracao = time.perf_counter() - inicio
+    if app.exception:
+        raise RuntimeError(f'Erro ao executar a página: {app.exception[0].message}')
+
+    # Linhas gravadas no log durante esta execução (a última é a do rerun da página)
+    with open(registro_metricas, encoding = 'utf-8') as arquivo:
+        arquivo.seek(posicao)
+        totais = [json.loads(linha)['total_ms'] for linha in arquivo if linha.strip()]
+    # Um rerun só de um fragmento não chega ao finaliza_rerun; nesse caso fica o tempo medido por fora
+    return totais[-1] / 1000 if totais else duracao
+
+
+def mede_pagina(arquivo, interacoes, tempo_limite):
+    # Pico de memória da primeira execução, medido à parte porque o tracemalloc deixa tudo mais lento
+    st.cache_resource.clear()
+    tracemalloc.start()
+    _executa(AppTest.from_file(arquivo, default_timeout = tempo_limite))
+    _, pico_frio = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Primeira execução com o cache vazio, depois cada interação em sequência
+    st.cache_resource.clear()
+    app = AppTest.from_file(arquivo, default_timeout = tempo_limite)
+    inicio_frio = _executa(app)
+
+    resultado = {'inicio_frio_s': inicio_frio, 'pico_memoria_inicio_mb': pico_frio / 1024 ** 2, 'interacoes_s': {}}
+    for nome, interacao in interacoes:
+        interacao(app)
+        resultado['interacoes_s'][nome] = _executa(app)
+    resultado['rerun_sem_mudanca_s'] = _executa(app)
+    return resultado
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = raiz, capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _pico_memoria_processo_mb():
+    try:
+        import resource
+    except ImportError:
+        return None     # O módulo resource não existe no Windows
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # No Linux o valor vem em KB
+
+
+def executa(linhas, fonte, tempo_limite, semente = 0):
+    with tempfile.TemporaryDirectory() as pasta:
+        dados = gera_produtos(linhas, semente)
+        if fonte == 'http':
+            url, servidor = inicia_servidor(json.loads(dados.to_json(orient = 'records', force_ascii = False)))
+            utils.carregamento.fonte = url
+        else:
+            caminho = os.path.join(pasta, 'produtos.json')
+            salva_json(dados, caminho)
+            utils.carregamento.fonte = caminho
+        # O snapshot de PRODUTOS_SNAPSHOT (se estiver definido) receberia as linhas sintéticas; aqui os dados
+        # são sempre lidos da fonte gerada
+        utils.carregamento.caminho_snapshot = ''
+        del dados
+
+        try:
+            return {
+                'data': datetime.datetime.now().isoformat(timespec = 'seconds'),
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'streamlit': st.__version__,
+                'linhas': linhas,
+                'fonte': fonte,
+                'backend': utils.backends.backend,
+                'dashboard': mede_pagina(dashboard, interacoes_dashboard, tempo_limite),
+                'dados_brutos': mede_pagina(dados_brutos, interacoes_dados_brutos, tempo_limite),
+                'pico_memoria_processo_mb': _pico_memoria_processo_mb(),
+            }
+        finally:
+            if fonte == 'http':
+                servidor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Mede o desempenho das páginas com dados sintéticos')
+    parser.add_argument('--linhas', type = int, nargs = '+', default = [10_000, 100_000])
+    parser.add_argument('--fonte', choices = ['arquivo', 'http'], default = 'arquivo',
+                        help = 'ler um arquivo json local ou passar por um servidor HTTP local (inclui o download)')
+    parser.add_argument('--saida', default = str(raiz / 'benchmarks' / 'resultados.jsonl'))
+    parser.add_argument('--tempo-limite', type = float, default = 600, help = 'segundos máximos para cada execução de página')
+    argumentos = parser.parse_args()
+
+    for linhas in argumentos.linhas:
+        resultado = executa(linhas, argumentos.fonte, argumentos.tempo_limite)
+        with open(argumentos.saida, 'a', encoding = 'utf-8') as arquivo:
+            arquivo.write(json.dumps(resultado, ensure_ascii = False) + '\n')
+        print(f"{linhas} linhas: Dashboard {resultado['dashboard']['inicio_frio_s']:.2f}s, "
+              f"Dados brutos {resultado['dados_brutos']['inicio_frio_s']:.2f}s (primeira execução)")
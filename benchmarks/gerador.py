@@ -0,0 +1,102 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from utils.esquema import colunas
+from utils.regioes import coordenadas_estados
+
+# Gerador de dados sintéticos com o mesmo formato da API de produtos (mesmas colunas, datas em dd/mm/aaaa),
+# para medir o desempenho das páginas com qualquer quantidade de linhas (de 10 mil a 10 milhões).
+#
+# Uso: python -m benchmarks.gerador 1000000 produtos.json
+
+# (produto, categoria, preço médio)
+produtos = [
+    ('Modelagem preditiva', 'livros', 90), ('Iniciando em programação', 'livros', 50),
+    ('Dashboards com Power BI', 'livros', 60), ('Celular ABXY', 'eletronicos', 1800),
+    ('Smart TV', 'eletronicos', 2300), ('Fone de ouvido', 'eletronicos', 150),
+    ('Notebook', 'eletronicos', 3500), ('Cadeira de escritório', 'moveis', 450),
+    ('Mesa de jantar', 'moveis', 900), ('Guarda roupas', 'moveis', 1100),
+    ('Geladeira', 'eletrodomesticos', 3200), ('Lavadora de roupas', 'eletrodomesticos', 2100),
+    ('Micro-ondas', 'eletrodomesticos', 700), ('Bola de futebol', 'esporte e lazer', 80),
+    ('Bicicleta', 'esporte e lazer', 1200), ('Violão', 'instrumentos musicais', 600),
+    ('Bateria', 'instrumentos musicais', 2500), ('Carrinho controle remoto', 'brinquedos', 150),
+    ('Jogo de tabuleiro', 'brinquedos', 120), ('Panela de pressão', 'utilidades domesticas', 80),
+]
+
+vendedores = ['Pedro Gomes', 'Beatriz Moraes', 'Thiago Silva', 'Rafael Costa', 'Juliana Ferreira',
+              'Mariana Ferreira', 'Lucas Oliveira', 'Bruno Rodrigues', 'Maria Souza', 'Camila Ribeiro',
+              'Larissa Alves', 'Isabella Pereira', 'Letícia Ferreira', 'Felipe Santos']
+
+# Estados do que mais vende para o que menos vende (aproximadamente a ordem da população). O peso de cada um
+# cai com a posição (1, 1/2, 1/3, ...), para que o mapa não fique uniforme: SP com mais vendas, depois MG, RJ...
+ufs = ['SP', 'MG', 'RJ', 'BA', 'PR', 'RS', 'PE', 'CE', 'PA', 'SC', 'GO', 'MA', 'AM', 'ES', 'PB', 'MT', 'RN',
+       'AL', 'PI', 'DF', 'MS', 'SE', 'RO', 'TO', 'AC', 'AP', 'RR']
+peso_ufs = 1 / np.arange(1, len(ufs) + 1)
+
+pagamentos = ['cartao_credito', 'boleto', 'cupom', 'cartao_debito']
+peso_pagamentos = [0.7, 0.2, 0.05, 0.05]
+
+inicio, fim = pd.Timestamp('2020-01-01'), pd.Timestamp('2023-12-31')
+
+LINHAS_POR_BLOCO = 500_000      # Linhas gravadas de cada vez no arquivo json
+
+
+def gera_produtos(linhas, semente = 0):
+    '''Gera um dataframe com as colunas da API de produtos (a data no formato de texto dd/mm/aaaa).'''
+    aleatorio = np.random.default_rng(semente)
+
+    uf = aleatorio.choice(len(ufs), linhas, p = peso_ufs / peso_ufs.sum())
+
+    produto = aleatorio.integers(0, len(produtos), linhas)
+    preco_medio = np.array([preco for _, _, preco in produtos], dtype = float)[produto]
+    preco = np.round(preco_medio * aleatorio.lognormal(0, 0.3, linhas), 2)
+    frete = np.round(np.clip(preco * 0.05 + aleatorio.normal(0, 5, linhas), 0, None), 2)
+
+    # Formatamos só as datas distintas e depois repetimos, o que é bem mais rápido que formatar cada linha
+    dias = pd.date_range(inicio, fim, freq = 'D')
+    data = dias.strftime('%d/%m/%Y').to_numpy()[aleatorio.integers(0, len(dias), linhas)]
+
+    pagamento = aleatorio.choice(len(pagamentos), linhas, p = peso_pagamentos)
+    parcelas = np.where(pagamento == 0, aleatorio.integers(1, 25, linhas), 1)
+    avaliacao = aleatorio.choice([1, 2, 3, 4, 5], linhas, p = [0.1, 0.05, 0.1, 0.25, 0.5])
+
+    coordenadas = np.array([coordenadas_estados[sigla] for sigla in ufs])
+    dados = pd.DataFrame({
+        'Produto': pd.Categorical.from_codes(produto, [nome for nome, _, _ in produtos]),
+        'Categoria do Produto': np.array([categoria for _, categoria, _ in produtos])[produto],
+        'Preço': preco,
+        'Frete': frete,
+        'Data da Compra': data,
+        'Vendedor': pd.Categorical.from_codes(aleatorio.integers(0, len(vendedores), linhas), vendedores),
+        'Local da compra': pd.Categorical.from_codes(uf, ufs),
+        'Avaliação da compra': avaliacao,
+        'Tipo de pagamento': pd.Categorical.from_codes(pagamento, pagamentos),
+        'Quantidade de parcelas': parcelas,
+        'lat': coordenadas[uf, 0],
+        'lon': coordenadas[uf, 1],
+    })
+    return dados[colunas]
+
+
+def salva_json(dados, caminho):
+    # Grava no mesmo formato da API (lista de registros), em blocos para não montar o texto inteiro em memória
+    with open(caminho, 'w', encoding = 'utf-8') as arquivo:
+        arquivo.write('[')
+        for inicio_bloco in range(0, len(dados), LINHAS_POR_BLOCO):
+            if inicio_bloco:
+                arquivo.write(',')
+            bloco = dados.iloc[inicio_bloco:inicio_bloco + LINHAS_POR_BLOCO]
+            arquivo.write(bloco.to_json(orient = 'records', force_ascii = False)[1:-1])
+        arquivo.write(']')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Gera dados sintéticos no formato da API de produtos')
+    parser.add_argument('linhas', type = int)
+    parser.add_argument('arquivo', help = 'arquivo json de saída')
+    parser.add_argument('--semente', type = int, default = 0)
+    argumentos = parser.parse_args()
+
+    salva_json(gera_produtos(argumentos.linhas, argumentos.semente), argumentos.arquivo)
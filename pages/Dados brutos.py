@@ -1,13 +1,16 @@
 import streamlit as st
-import requests
 import pandas as pd
 import plotly.express as px
 import time
 
+from utils.carregamento import botao_atualizar, carrega_dados, carrega_estados, dados_atualizados
+from utils.esquema import colunas_coordenadas
+from utils.exportacao import abre_exportacao, chave_exportacao, formatos
+from utils.filtros import mascara_filtros
+from utils.instrumentacao import finaliza_rerun, inicia_rerun, painel_debug
+from utils.recorte import Recorte
+from utils.tabela import tabela_paginada
 
-@st.cache_data
-def converte_csv(df):
-    return df.to_csv(index = False).encode('utf-8')     # index = False para não salvar o index do dataframe no csv
 
 def mensagem_sucesso():
     sucesso = st.success('Arquivo baixado com sucesso!', icon = '🎉')   # Mostra o sucesso na tela
@@ -15,29 +18,46 @@ def mensagem_sucesso():
     sucesso.empty()    # Apaga a mensagem de sucesso da tela
 
 
+def prepara_arquivo(chave):
+    st.session_state['exportacao_preparada'] = chave
+
+
+def arquivo_baixado():
+    # Depois do download, o arquivo deixa de ser enviado a cada rerun; um novo download precisa ser preparado de novo
+    st.session_state.pop('exportacao_preparada', None)
+    mensagem_sucesso()
+
+
 st.title('DADOS BRUTOS') 
 
-url = 'https://labdados.com/produtos'
+inicia_rerun('Dados brutos')    # Começa a medir os tempos de cada etapa deste rerun (veja utils/instrumentacao.py)
+
+# Com o copy-on-write do pandas, os dataframes derivados dividem a memória com os dados compartilhados até que alguém tente alterá-los
+pd.set_option('mode.copy_on_write', True)
 
-response = requests.get(url)
+botao_atualizar()
 
-dados = pd.DataFrame.from_dict(response.json())
+dados = carrega_dados()     # Mesmo cache usado pelo Dashboard: os widgets desta página não geram novas requisições
+estados = carrega_estados()     # lat e lon ficam em uma tabela à parte, uma linha por estado
 
-dados['Data da Compra'] = pd.to_datetime(dados['Data da Compra'], format = '%d/%m/%Y')
+if dados_atualizados():     # Os dados foram recarregados (por esta ou por outra sessão) desde o último rerun
+    st.info('Os dados foram atualizados.')
 
 
 with st.expander('Colunas'):
-    colunas = st.multiselect('Selecione as colunas', list(dados.columns), list(dados.columns))   # (label, opções, padrão (no caso está selecionando todas as colunas como padrão))
+    todas_colunas = list(dados.columns) + colunas_coordenadas
+    colunas = st.multiselect('Selecione as colunas', todas_colunas, todas_colunas)   # (label, opções, padrão (no caso está selecionando todas as colunas como padrão))
 
 st.sidebar.title('Filtros')
 
 ###### Criando elementos expansivos para não poluir a tela
+# As colunas de texto são categorias, então as opções de cada filtro vêm direto da lista de categorias, sem percorrer as linhas
 
 with st.sidebar.expander('Nome do produto'):    # (label)
-    produtos = st.multiselect('Selecione os produtos', dados['Produto'].unique(), dados['Produto'].unique())   # (label, opções, padrão (no caso está selecionando todas as colunas como padrão))
+    produtos = st.multiselect('Selecione os produtos', list(dados['Produto'].cat.categories), list(dados['Produto'].cat.categories))   # (label, opções, padrão (no caso está selecionando todas as colunas como padrão))
 
 with st.sidebar.expander('Categoria do Produto'):    # (label)
-    categoria = st.multiselect('Selecione os produtos', dados['Categoria do Produto'].unique(), dados['Categoria do Produto'].unique())
+    categoria = st.multiselect('Selecione os produtos', list(dados['Categoria do Produto'].cat.categories), list(dados['Categoria do Produto'].cat.categories))
 
 with st.sidebar.expander('Preço do produto'):    # 
     preco = st.slider('Selecione o preço', 0, 5000, (0, 5000))   # (label, min, max, padrão (no caso está selecionando todo o intervalo como padrão))
@@ -49,46 +69,47 @@ with st.sidebar.expander('Data da Compra'):
     data_compra = st.date_input('Selecione a data da compra', (dados['Data da Compra'].min(), dados['Data da Compra'].max()))   # (label, (data mín, data max))
 
 with st.sidebar.expander('Vendedor'):    # (label)
-    vendedores = st.multiselect('Selecione os produtos', dados['Vendedor'].unique(), dados['Vendedor'].unique())
+    vendedores = st.multiselect('Selecione os produtos', list(dados['Vendedor'].cat.categories), list(dados['Vendedor'].cat.categories))
 
 with st.sidebar.expander('Local da Compra'):    # (label)
-    local_compra = st.multiselect('Selecione os produtos', dados['Local da compra'].unique(), dados['Local da compra'].unique())
+    local_compra = st.multiselect('Selecione os produtos', list(dados['Local da compra'].cat.categories), list(dados['Local da compra'].cat.categories))
 
 with st.sidebar.expander('Avaliação da Compra'):   
     avaliacao = st.slider('Selecione o preço', 1, 5, (1, 5))	
 
 with st.sidebar.expander('Tipo de Pagamento'):    # (label)
-    tipo_pagamento = st.multiselect('Selecione os produtos', dados['Tipo de pagamento'].unique(), dados['Tipo de pagamento'].unique())
+    tipo_pagamento = st.multiselect('Selecione os produtos', list(dados['Tipo de pagamento'].cat.categories), list(dados['Tipo de pagamento'].cat.categories))
 
 with st.sidebar.expander('Quantidade de parcelas'):   
     qtd_parcelas = st.slider('Selecione o preço', 1, 24, (1, 24))	
 
 
-###### Criando a query para filtrar os dados
+###### Filtrando os dados
 
-# O que tiver com o @ na frente é uma variável que criamos no with acima, sem o @ é uma coluna do dataframe
-# O and no final é para concatenar com a próxima linha
-# O \ no final é para quebrar a linha e não ficar tudo na mesma linha
-# O @preco[0] é o valor mínimo do slider e o @preco[1] é o valor máximo do slider
-# Quando o nome da coluna possui espaço, é necessário colocar o nome entre crases
+# Cada filtro é passado para o motor de filtros como {coluna: valores selecionados} ou {coluna: (mínimo, máximo)}
+# O motor guarda a máscara de cada filtro, então ao mexer em um widget só aquele filtro é recalculado
+# Filtros que selecionam todos os valores (como os padrões) são ignorados
 
-query = '''
-Produto in @produtos and \
-`Categoria do Produto` in @categoria and \
-@preco[0] <= Preço <= @preco[1] and \
-@frete[0] <= Frete <= @frete[1] and \
-@data_compra[0] <= `Data da Compra` <= @data_compra[1] and \
-Vendedor in @vendedores and \
-`Local da compra` in @local_compra and \
-@avaliacao[0] <= `Avaliação da compra` <= @avaliacao[1] and \
-`Tipo de pagamento` in @tipo_pagamento and \
-@qtd_parcelas[0] <= `Quantidade de parcelas` <= @qtd_parcelas[1]
-'''
+filtros = {
+    'Produto': produtos,
+    'Categoria do Produto': categoria,
+    'Preço': preco,
+    'Frete': frete,
+    'Data da Compra': data_compra,
+    'Vendedor': vendedores,
+    'Local da compra': local_compra,
+    'Avaliação da compra': avaliacao,
+    'Tipo de pagamento': tipo_pagamento,
+    'Quantidade de parcelas': qtd_parcelas,
+}
 
-dados_filtrados = dados.query(query)    # Filtrando os dados
-dados_filtrados = dados_filtrados[colunas]    # Filtrando as colunas selecionadas
+# Os dados são compartilhados com as outras sessões, então não copiamos as linhas filtradas:
+# o recorte guarda só as posições das linhas que passaram nos filtros e as colunas selecionadas
+# (a latitude e longitude de cada estado são trazidas da tabela de estados quando as linhas forem exibidas)
+mascara = mascara_filtros(dados, filtros)    # Filtrando os dados
+dados_filtrados = Recorte.da_mascara(dados, mascara, colunas = colunas, estados = estados)
 
-st.dataframe(dados_filtrados) 
+tabela_paginada(dados_filtrados, 'dados_brutos')     # Só a página atual da tabela é enviada para o navegador
 
 # Escrevendo um texto para conferir o tamanho da tabela
 # O :blue é para deixar o texto azul
@@ -97,12 +118,28 @@ st.markdown(f'A tabela possui :blue[{dados_filtrados.shape[0]}] linhas e :blue[{
 
 ###### Criando o botão para fazer o download da tabela filtrada
 
-st.markdown('Escreva um nome para o arquivo')
-coluna1, coluna2 = st.columns(2)    # Criando duas colunas
+st.markdown('Escreva um nome para o arquivo e escolha o formato')
+coluna1, coluna2, coluna3 = st.columns(3)    # Criando três colunas
 
 with coluna1:
     nome_arquivo = st.text_input('', label_visibility = 'collapsed', value = 'dados')    # (label, tirar a label vazia do campo de digitação ,valor padrão (se não digitar nada))
-    nome_arquivo += '.csv'    # Adicionando a extensão .csv ao nome do arquivo
 
 with coluna2:
-    st.download_button('Fazer o downloado da tabela em csv', data = converte_csv(dados_filtrados), file_name = nome_arquivo, mime = 'text/csv', on_click = mensagem_sucesso)   # (label, arquivo, nome do arquivo, tipo do arquivo, função que será executada ao clicar no botão)
+    formato = st.selectbox('Formato', list(formatos), label_visibility = 'collapsed')   # CSV, CSV compactado ou Parquet (os dois últimos geram arquivos bem menores)
+    extensao, tipo_arquivo = formatos[formato]
+    nome_arquivo += extensao    # Adicionando a extensão ao nome do arquivo
+
+with coluna3:
+    # O botão de download lê o arquivo inteiro a cada rerun em que aparece, então ele só é mostrado depois que o usuário
+    # pede o arquivo, e só enquanto os filtros, as colunas e o formato continuarem os mesmos
+    chave = chave_exportacao(filtros, colunas, formato)
+    if st.session_state.get('exportacao_preparada') != chave:
+        st.button('Preparar arquivo', on_click = prepara_arquivo, args = (chave,))
+    else:
+        # O arquivo é gerado em blocos e guardado em cache pelos filtros escolhidos: se os filtros não mudarem, ele não é gerado de novo
+        with abre_exportacao(dados_filtrados, chave) as arquivo:
+            st.download_button(f'Fazer o download da tabela em {formato}', data = arquivo, file_name = nome_arquivo, mime = tipo_arquivo, on_click = arquivo_baixado)   # (label, arquivo, nome do arquivo, tipo do arquivo, função que será executada ao clicar no botão)
+
+# Fim do rerun: registra os tempos medidos e mostra o painel de tempos, se ele estiver marcado na sidebar
+finaliza_rerun()
+painel_debug()
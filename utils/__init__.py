@@ -0,0 +1 @@
+# Módulos de apoio compartilhados pelo Dashboard.py e pelas páginas em pages/
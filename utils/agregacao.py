@@ -0,0 +1,66 @@
+import threading
+
+import streamlit as st
+
+from utils.backends import dimensoes, monta_cubo
+from utils.carregamento import ao_atualizar_dados
+from utils.instrumentacao import etapa, medido
+
+# Cubo de vendas: soma e contagem do 'Preço' por (estado, mês, categoria, vendedor), calculado uma única vez
+# para cada recorte de região/ano. Todas as tabelas do Dashboard saem de agregações desse cubo, que tem
+# poucas linhas (uma por combinação existente) em vez de uma por venda.
+# O cubo é montado pelo backend configurado (pandas, DuckDB ou Polars, veja utils/backends.py).
+
+coluna_mes = 'Data da Compra'      # No cubo, a data já vem agrupada por mês (último dia do mês, como no pd.Grouper)
+
+
+@st.cache_resource
+def _cubos():
+    # Cubos já calculados: {chave do filtro: (dataframe de origem, posições do recorte, cubo)}
+    return {'cubos': {}, 'trava': threading.Lock()}
+
+
+@ao_atualizar_dados
+def _limpa_cubos():
+    # Dados novos: os cubos antigos (e os dataframes de origem que eles referenciam) são descartados
+    memoria = _cubos()
+    with memoria['trava']:
+        memoria['cubos'].clear()
+
+
+def cubo_vendas(recorte, chave):
+    '''Retorna o cubo de vendas do recorte (utils/recorte.py), memorizado pela chave do filtro (regiao, ano).
+
+    Se o dataframe ou as posições guardadas para a chave não forem os mesmos objetos (os dados foram
+    atualizados), o cubo é calculado de novo. Só as colunas usadas pelo cubo são copiadas, e só durante o cálculo.
+    '''
+    memoria = _cubos()
+    with memoria['trava']:
+        guardado = memoria['cubos'].get(chave)
+        if guardado is None or guardado[0] is not recorte.dados or guardado[1] is not recorte.posicoes:
+            with etapa('cubo de vendas'):
+                guardado = (recorte.dados, recorte.posicoes, monta_cubo(recorte.linhas(dimensoes + ['Preço'])))
+            memoria['cubos'][chave] = guardado
+    return guardado[2]
+
+
+def filtra_cubo(cubo, vendedores):
+    # O vendedor é uma das dimensões do cubo, então o filtro de vendedores é aplicado direto nele
+    if vendedores:
+        cubo = cubo[cubo['Vendedor'].isin(vendedores)]
+    return cubo
+
+
+@medido('tabelas')
+def agrega(cubo, coluna):
+    # Soma e contagem por uma das dimensões, só com os valores que aparecem no cubo
+    return cubo.groupby(coluna, observed = True)[['sum', 'count']].sum()
+
+
+@medido('tabelas')
+def agrega_mensal(cubo):
+    # Soma e contagem por mês, preenchendo com zero os meses sem vendas (como o pd.Grouper fazia)
+    mensal = cubo.groupby(coluna_mes)[['sum', 'count']].sum().resample('M').sum().reset_index()
+    mensal['Ano'] = mensal[coluna_mes].dt.year
+    mensal['Mês'] = mensal[coluna_mes].dt.month_name()
+    return mensal
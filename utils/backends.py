@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+
+import pandas as pd
+
+# Backends de agregação: cada um monta o cubo de vendas (soma e contagem do 'Preço' por estado, mês,
+# categoria e vendedor) a partir do mesmo dataframe e devolve exatamente o mesmo resultado.
+# O pandas usa um único núcleo; DuckDB e Polars (opcionais, instale com pip) usam todos os núcleos,
+# o que faz diferença em conjuntos de vários anos. As tabelas do Dashboard saem do cubo (utils/agregacao.py),
+# então trocar de backend não muda nenhum gráfico.
+#
+# Escolha o backend com a variável de ambiente PRODUTOS_BACKEND (pandas, duckdb ou polars).
+# Para conferir que um backend dá o mesmo resultado que o pandas:
+#   python -m utils.backends produtos.json duckdb polars
+
+backend = os.environ.get('PRODUTOS_BACKEND', 'pandas')
+
+dimensoes = ['Local da compra', 'Data da Compra', 'Categoria do Produto', 'Vendedor']    # No cubo, a data é o último dia do mês
+
+
+def cubo_pandas(dados):
+    agrupamento = ['Local da compra', pd.Grouper(key = 'Data da Compra', freq = 'M'), 'Categoria do Produto', 'Vendedor']
+    return dados.groupby(agrupamento, observed = True)['Preço'].agg(['sum', 'count']).reset_index()
+
+
+def cubo_duckdb(dados):
+    import duckdb
+
+    with duckdb.connect() as conexao:
+        conexao.register('dados', dados)
+        return conexao.execute('''
+            SELECT "Local da compra",
+                   CAST(last_day("Data da Compra") AS TIMESTAMP) AS "Data da Compra",
+                   "Categoria do Produto",
+                   "Vendedor",
+                   sum("Preço") AS "sum",
+                   count("Preço") AS "count"
+            FROM dados
+            GROUP BY ALL
+        ''').df()
+
+
+def cubo_polars(dados):
+    import polars as pl
+
+    return (pl.from_pandas(dados[['Local da compra', 'Data da Compra', 'Categoria do Produto', 'Vendedor', 'Preço']])
+              .group_by(pl.col('Local da compra'), pl.col('Data da Compra').dt.month_end(), pl.col('Categoria do Produto'), pl.col('Vendedor'))
+              .agg(pl.col('Preço').sum().alias('sum'), pl.col('Preço').count().alias('count'))
+              .to_pandas())
+
+
+backends = {
+    'pandas': cubo_pandas,
+    'duckdb': cubo_duckdb,
+    'polars': cubo_polars,
+}
+
+
+def _padroniza(cubo, dados):
+    # Mesmos tipos e mesma ordem de linhas do pandas, para que o resultado não dependa do backend
+    for coluna in dimensoes:
+        if isinstance(dados[coluna].dtype, pd.CategoricalDtype):
+            cubo[coluna] = pd.Categorical(cubo[coluna].astype(str), categories = dados[coluna].cat.categories)
+    cubo['Data da Compra'] = cubo['Data da Compra'].astype('datetime64[ns]')
+    cubo = cubo.astype({'sum': 'float64', 'count': 'int64'})
+    return cubo[dimensoes + ['sum', 'count']].sort_values(dimensoes, ignore_index = True)
+
+
+def monta_cubo(dados, nome = None):
+    # Monta o cubo com o backend escolhido (o da configuração, se nenhum for informado)
+    nome = nome or backend
+    if nome not in backends:
+        raise ValueError(f'Backend de agregação desconhecido: {nome!r} (opções: {", ".join(backends)})')
+    return _padroniza(backends[nome](dados), dados)
+
+
+def confere_backend(dados, nome):
+    # Gera um erro (AssertionError) se o backend não der o mesmo cubo que o pandas
+    pd.testing.assert_frame_equal(monta_cubo(dados, nome), monta_cubo(dados, 'pandas'), check_exact = False)
+
+
+if __name__ == '__main__':
+    from utils.carregamento import trata_dados
+    from utils.esquema import tipa_dados
+
+    parser = argparse.ArgumentParser(description = 'Confere se os backends de agregação dão o mesmo resultado que o pandas')
+    parser.add_argument('arquivo', help = 'arquivo json com os produtos (mesmo formato da API)')
+    parser.add_argument('nomes', nargs = '+', choices = list(backends))
+    argumentos = parser.parse_args()
+
+    with open(argumentos.arquivo, encoding = 'utf-8') as arquivo:
+        dados, _ = tipa_dados(trata_dados(json.load(arquivo)))
+    for nome in argumentos.nomes:
+        confere_backend(dados, nome)
+        print(f'{nome}: mesmo resultado que o pandas')
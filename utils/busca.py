@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Download particionado: em vez de uma única requisição grande e sequencial, o recorte pedido é dividido
+# nas partições que a API já aceita (cada região x cada ano) e as partições são baixadas em paralelo,
+# com um limite de requisições simultâneas. Os timeouts e as novas tentativas (com espera crescente)
+# ficam na sessão HTTP (veja sessao_http em utils/carregamento.py).
+
+MAX_PARALELO = 8    # Quantidade máxima de requisições simultâneas
+
+
+def particoes(regioes, anos):
+    # Todas as combinações (regiao, ano) que formam o recorte
+    return [(regiao, str(ano)) for regiao in regioes for ano in anos]
+
+
+def _baixa(sessao, url, particao, validadores, timeout):
+    regiao, ano = particao
+    cabecalhos = {}
+    etag, last_modified = validadores.get(particao, (None, None))
+    if etag:
+        cabecalhos['If-None-Match'] = etag
+    if last_modified:
+        cabecalhos['If-Modified-Since'] = last_modified
+
+    response = sessao.get(url, params = {'regiao': regiao, 'ano': ano}, headers = cabecalhos, timeout = timeout)
+    leitura = 0.0
+    if response.status_code == 304:
+        json = None     # A partição não mudou desde a última vez
+    else:
+        response.raise_for_status()
+        inicio = time.perf_counter()
+        json = response.json()
+        leitura = time.perf_counter() - inicio
+    return json, (response.headers.get('ETag'), response.headers.get('Last-Modified')), leitura
+
+
+def baixa_particoes(sessao, url, lista_particoes, validadores = None, timeout = None, max_paralelo = MAX_PARALELO):
+    '''Baixa as partições em paralelo e retorna ({particao: (json, (etag, last_modified))}, segundos lendo json).
+
+    validadores é {particao: (etag, last_modified)} de um download anterior; as partições que não
+    mudaram voltam com json None. Um erro em qualquer partição é repassado para quem chamou.
+    O tempo de leitura do json é a soma do que cada thread gastou convertendo as respostas.
+    '''
+    validadores = validadores or {}
+    with ThreadPoolExecutor(max_workers = max(min(max_paralelo, len(lista_particoes)), 1)) as executor:
+        futuros = {particao: executor.submit(_baixa, sessao, url, particao, validadores, timeout) for particao in lista_particoes}
+        resultados = {particao: futuro.result() for particao, futuro in futuros.items()}
+    respostas = {particao: (json, validador) for particao, (json, validador, _) in resultados.items()}
+    return respostas, sum(leitura for _, _, leitura in resultados.values())
+
+
+def junta_particoes(jsons, colunas):
+    # Monta um dataframe por partição e junta todos de uma vez (uma única cópia para o resultado final)
+    partes = [pd.DataFrame.from_dict(json) for json in jsons if len(json)]
+    if not partes:
+        return pd.DataFrame(columns = colunas)
+    return pd.concat(partes, ignore_index = True, copy = False)
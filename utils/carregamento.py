@@ -0,0 +1,346 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.busca import baixa_particoes, junta_particoes, particoes
+from utils.esquema import anota_memoria, colunas, junta_tipados, tipa_dados
+from utils.instrumentacao import etapa, medido, registra_etapa
+from utils.recorte import Recorte
+from utils.regioes import estados_por_regiao
+from utils.snapshot import abre_snapshot, sincroniza_snapshot, versao_snapshot
+
+# Módulo único de acesso aos dados, usado tanto pelo Dashboard.py quanto pela página "Dados brutos".
+# Assim, mexer em um widget não dispara uma nova requisição: a fonte só é consultada de novo
+# quando o cache expira (TTL) ou quando o usuário clica em "Atualizar dados".
+#
+# Os dataframes ficam em um cache único do processo (st.cache_resource, que não copia nada), então todas as
+# sessões leem a mesma cópia dos dados, que nunca deve ser alterada. Os recortes de região/ano e cada sessão
+# guardam só as posições das linhas que usam (veja utils/recorte.py), e o que é calculado a partir dos dados
+# (cubos, índices dos filtros) é descartado quando dados novos são carregados.
+
+url = 'https://labdados.com/produtos'       # Url da API
+
+# De onde vêm os dados: a url da API ou o caminho de um arquivo json local com o mesmo formato
+# (útil para trabalhar offline e nos testes)
+fonte = os.environ.get('PRODUTOS_FONTE', url)
+
+# Pasta do snapshot local (Arrow). Se estiver vazio, os dados são lidos direto da fonte
+caminho_snapshot = os.environ.get('PRODUTOS_SNAPSHOT', '')
+
+# Anos que a API aceita no parâmetro 'ano'. Os downloads são divididos em partições (região x ano)
+anos_disponiveis = [2020, 2021, 2022, 2023]
+
+TTL_SEGUNDOS = 600      # Tempo (em segundos) em que um resultado é considerado atual sem consultar a fonte
+TIMEOUT = (5, 30)       # Tempo máximo (em segundos) para conectar e para receber a resposta da API
+TENTATIVAS = 3          # Novas tentativas em caso de falha, esperando 0,5s, 1s, 2s... entre elas
+
+
+@st.cache_resource
+def sessao_http():
+    # Uma única sessão por processo, reaproveitando as conexões abertas (pool) entre as requisições
+    # Erros de conexão e respostas 429/5xx são tentados de novo, com uma espera que dobra a cada tentativa
+    sessao = requests.Session()
+    tentativas = Retry(total = TENTATIVAS, backoff_factor = 0.5, status_forcelist = [429, 500, 502, 503, 504], allowed_methods = ['GET'])
+    adaptador = HTTPAdapter(pool_connections = 4, pool_maxsize = 16, max_retries = tentativas)
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    return sessao
+
+
+@st.cache_resource
+def _armazenamento():
+    # Cache compartilhado pelo processo: {(regiao, ano): entrada}, protegido por uma trava.
+    # 'estados' guarda a tabela com a latitude e longitude de todos os estados já carregados,
+    # 'versao' é incrementada sempre que dados novos são carregados e 'travas' tem uma trava por origem
+    # (só uma sessão carrega cada origem por vez)
+    return {'entradas': {}, 'estados': None, 'versao': 0, 'travas': {}, 'trava': threading.Lock()}
+
+
+def _fonte_local():
+    return not fonte.startswith(('http://', 'https://'))
+
+
+@medido('conversão das datas')
+def converte_datas(dados):
+    # Transformando a coluna 'Data da Compra' em datetime
+    dados['Data da Compra'] = pd.to_datetime(dados['Data da Compra'], format = '%d/%m/%Y')
+    return dados
+
+
+def trata_dados(json):
+    # Transformando o json em um dataframe, já com as datas convertidas
+    with etapa('montagem do dataframe'):
+        dados = pd.DataFrame.from_dict(json)
+    return converte_datas(dados)
+
+
+def posicoes_local(dados, regiao = '', ano = ''):
+    # Aplica em memória os mesmos filtros de região e ano que a API aplica, devolvendo só as posições das linhas
+    mascara = np.ones(len(dados), dtype = bool)
+    if regiao:
+        mascara &= dados['Local da compra'].isin(estados_por_regiao[regiao.lower()]).to_numpy()
+    if ano:
+        mascara &= (dados['Data da Compra'].dt.year == int(ano)).to_numpy()
+    return np.flatnonzero(mascara).astype(np.int32 if len(dados) < 2 ** 31 else np.int64, copy = False)
+
+
+def _particoes_do_recorte(regiao, ano):
+    # Um recorte sem região ou sem ano é dividido em todas as regiões ou em todos os anos
+    regioes = [regiao] if regiao else list(estados_por_regiao)
+    anos = [ano] if ano else anos_disponiveis
+    return particoes(regioes, anos)
+
+
+def _posicoes_particoes(dados, lista_particoes):
+    # Posições das linhas que pertencem a alguma das partições (regiao, ano): a API devolve em cada partição
+    # as vendas dos estados da região naquele ano
+    anos = dados['Data da Compra'].dt.year.to_numpy()
+    da_regiao = {}
+    mascara = np.zeros(len(dados), dtype = bool)
+    for regiao, ano in lista_particoes:
+        if regiao not in da_regiao:
+            da_regiao[regiao] = dados['Local da compra'].isin(estados_por_regiao[regiao]).to_numpy()
+        mascara |= da_regiao[regiao] & (anos == int(ano))
+    return np.flatnonzero(mascara)
+
+
+def _baixa_particoes(lista_particoes, validadores = None):
+    # Baixa as partições e registra o download e a leitura do json como etapas separadas.
+    # A leitura é feita nas threads do download, mas segura o GIL (uma de cada vez), então ela é
+    # descontada do tempo total para sobrar o tempo das requisições
+    inicio = time.perf_counter()
+    respostas, leitura = baixa_particoes(sessao_http(), fonte, lista_particoes, validadores, TIMEOUT)
+    registra_etapa('download', max(time.perf_counter() - inicio - leitura, 0.0))
+    registra_etapa('leitura do json', leitura)
+    return respostas
+
+
+def _requisita(regiao, ano, entrada):
+    # Baixa as partições do recorte em paralelo. Se já temos um resultado, as requisições são condicionais:
+    # se todas as partições responderem 304, os dados que já temos continuam válidos
+    validadores = entrada['validadores'] if entrada is not None else {}
+    respostas = _baixa_particoes(_particoes_do_recorte(regiao, ano), validadores)
+
+    iguais = [particao for particao, (json, _) in respostas.items() if json is None]
+    if entrada is not None and len(iguais) == len(respostas):
+        dados, estados, filtrados = entrada['dados'], entrada['estados'], entrada['filtrados']
+    else:
+        # Só as partições que mudaram são montadas e tipadas; as linhas das que não mudaram (304) vêm do
+        # resultado anterior, sem baixar de novo (e ficam antes das linhas novas)
+        with etapa('montagem do dataframe'):
+            dados = junta_particoes([json for json, _ in respostas.values() if json is not None], colunas)
+        dados, estados = tipa_dados(converte_datas(dados))
+        if iguais:
+            with etapa('montagem do dataframe'):
+                anteriores = entrada['dados'].iloc[_posicoes_particoes(entrada['dados'], iguais)]
+                dados = junta_tipados([anteriores, dados])
+                estados = pd.concat([entrada['estados'], estados])
+                estados = estados[~estados.index.duplicated() & estados.index.isin(dados['Local da compra'].cat.categories)]
+        filtrados = {}
+
+    return {
+        'dados': dados,
+        'estados': estados,
+        'filtrados': filtrados,
+        'validadores': {particao: validador for particao, (_, validador) in respostas.items()},
+        'validado_em': time.monotonic(),
+    }
+
+
+def _le_fonte(anos = None):
+    # Lê a fonte completa, ou apenas os anos pedidos, sem passar pelo cache (usado pelo snapshot)
+    if _fonte_local():
+        with etapa('leitura do json'), open(fonte, encoding = 'utf-8') as arquivo:
+            registros = json.load(arquivo)
+        dados = trata_dados(registros)
+        if anos is not None:
+            dados = dados[dados['Data da Compra'].dt.year.isin(anos)]
+        return dados
+
+    # A API só aceita os anos disponíveis (a sincronização do snapshot pode pedir anos até o atual)
+    anos = anos_disponiveis if anos is None else [ano for ano in anos if ano in anos_disponiveis]
+    lista_particoes = particoes(list(estados_por_regiao), anos)
+    respostas = _baixa_particoes(lista_particoes)
+    with etapa('montagem do dataframe'):
+        dados = junta_particoes([json for json, _ in respostas.values()], colunas)
+    return converte_datas(dados)
+
+
+def _versao_arquivo(caminho):
+    # Data de modificação e tamanho do arquivo local: se não mudaram, o conteúdo é o mesmo da última leitura
+    informacoes = os.stat(caminho)
+    return informacoes.st_mtime_ns, informacoes.st_size
+
+
+def _carrega_completo(entrada):
+    # Carrega o conjunto completo quando não há como pedir o filtro direto para a API.
+    # Se já temos um resultado e o snapshot (ou o arquivo local) não mudou desde então, os dados que já temos
+    # continuam válidos: só a validade é renovada, como na API quando todas as partições respondem 304
+    if caminho_snapshot:
+        sincroniza_snapshot(caminho_snapshot, _le_fonte, datetime.date.today().year)
+        versao = versao_snapshot(caminho_snapshot)
+    else:
+        versao = _versao_arquivo(fonte)
+    if entrada is not None and entrada['validadores'].get('fonte') == versao:
+        return dict(entrada, validado_em = time.monotonic())
+
+    if caminho_snapshot:
+        with etapa('leitura do snapshot'):
+            dados, estados = abre_snapshot(caminho_snapshot)     # As partes já estão gravadas com os tipos compactos
+        anota_memoria(dados, estados)
+    else:
+        dados, estados = tipa_dados(_le_fonte())
+    return {'dados': dados, 'estados': estados, 'filtrados': {}, 'validadores': {'fonte': versao}, 'validado_em': time.monotonic()}
+
+
+def _recortes_que_cobrem(chave):
+    # Recortes cujo resultado contém o recorte pedido, do mais específico para o mais geral:
+    # todas as regiões contêm uma região e todos os anos contêm um ano
+    regiao, ano = chave
+    candidatos = [chave, (regiao, ''), ('', ano), ('', '')]
+    return list(dict.fromkeys(candidatos))     # Remove repetidos mantendo a ordem
+
+
+def _planeja(entradas, chave):
+    # Procura no cache um resultado atual que cubra o recorte pedido
+    for candidato in _recortes_que_cobrem(chave):
+        entrada = entradas.get(candidato)
+        if entrada is not None and time.monotonic() - entrada['validado_em'] <= TTL_SEGUNDOS:
+            return candidato, entrada
+    return None, None
+
+
+def carrega_recorte(regiao = '', ano = ''):
+    '''Retorna o Recorte (utils/recorte.py) dos produtos da região e do ano pedidos ('' significa todos).
+
+    Se algum resultado em cache já contém o recorte pedido (por exemplo, o Brasil inteiro quando se pede
+    uma região), o recorte é filtrado em memória e guarda só as posições das linhas; a fonte só é consultada
+    quando nada em cache o cobre. O dataframe do recorte é compartilhado entre as sessões e não deve ser alterado.
+    '''
+    chave = (regiao.lower(), str(ano))
+    armazenamento = _armazenamento()
+
+    with armazenamento['trava']:
+        origem, entrada = _planeja(armazenamento['entradas'], chave)
+    if entrada is None:
+        origem, entrada = _carrega(armazenamento, chave)
+
+    if origem == chave:
+        return Recorte(entrada['dados'])
+
+    # Guardamos as posições de cada recorte já filtrado, para que reruns com o mesmo filtro recebam as mesmas posições
+    # (se duas sessões calcularem o mesmo recorte ao mesmo tempo, fica o primeiro)
+    filtrados = entrada['filtrados']
+    if chave not in filtrados:
+        with etapa('filtro de região/ano'):
+            filtrados.setdefault(chave, posicoes_local(entrada['dados'], *chave))
+    return Recorte(entrada['dados'], filtrados[chave])
+
+
+def _carrega(armazenamento, chave):
+    # Consulta a fonte para o recorte pedido e guarda o resultado no cache.
+    # A trava geral só é usada para ler e gravar o cache, nunca durante o download ou a leitura dos dados:
+    # sessões que pedem recortes já em cache não esperam. Cada origem tem a sua trava, então se várias sessões
+    # pedirem a mesma origem ao mesmo tempo, só a primeira consulta a fonte e as outras reaproveitam o resultado
+
+    # Snapshot ou arquivo local: sempre carregamos o conjunto completo e filtramos em memória;
+    # na API, a requisição é feita só com o recorte pedido
+    completo = bool(caminho_snapshot) or _fonte_local()
+    origem = ('', '') if completo else chave
+    with armazenamento['trava']:
+        trava_origem = armazenamento['travas'].setdefault(origem, threading.Lock())
+
+    with trava_origem:
+        with armazenamento['trava']:
+            encontrada, entrada = _planeja(armazenamento['entradas'], chave)
+            anterior = armazenamento['entradas'].get(origem)
+        if entrada is not None:
+            return encontrada, entrada      # Outra sessão carregou enquanto esperávamos
+
+        # Revalida o resultado expirado, se houver
+        if completo:
+            entrada = _carrega_completo(anterior)
+        else:
+            entrada = _requisita(chave[0], chave[1], anterior)
+
+        with armazenamento['trava']:
+            anterior = armazenamento['entradas'].get(origem)
+            if anterior is not None and anterior['dados'] is not entrada['dados']:
+                _nova_versao(armazenamento)     # O resultado expirou e a fonte mandou dados novos
+            armazenamento['entradas'][origem] = entrada
+            _registra_estados(armazenamento, entrada['estados'])
+    return origem, entrada
+
+
+def carrega_dados():
+    # Dataframe completo dos produtos (compartilhado entre as sessões; não deve ser alterado no lugar)
+    return carrega_recorte().dados
+
+
+def _registra_estados(armazenamento, estados):
+    # Junta os estados recém-carregados com os que já conhecíamos
+    if armazenamento['estados'] is not None:
+        estados = pd.concat([armazenamento['estados'], estados])
+        estados = estados[~estados.index.duplicated()]
+    armazenamento['estados'] = estados
+
+
+def carrega_estados():
+    '''Retorna a tabela de estados (índice 'Local da compra', colunas lat e lon).
+
+    Deve ser chamada depois de carrega_recorte (ou carrega_dados), que é quem preenche a tabela.
+    '''
+    return _armazenamento()['estados']
+
+
+def limpa_cache():
+    # Descarta todos os resultados guardados, forçando uma nova consulta à fonte
+    armazenamento = _armazenamento()
+    with armazenamento['trava']:
+        armazenamento['entradas'].clear()
+        _nova_versao(armazenamento)
+
+
+# Funções que descartam o que foi calculado a partir dos dados (cubos, índices dos filtros...),
+# chamadas sempre que a versão dos dados muda, para que os dados antigos não fiquem presos na memória
+_limpezas = []
+
+
+def ao_atualizar_dados(funcao):
+    # Decorador: registra uma função de limpeza
+    _limpezas.append(funcao)
+    return funcao
+
+
+def _nova_versao(armazenamento):
+    armazenamento['versao'] += 1
+    for limpeza in _limpezas:
+        limpeza()
+
+
+def versao_dados():
+    # Número que muda sempre que dados novos são carregados (não muda quando a API responde 304)
+    return _armazenamento()['versao']
+
+
+def dados_atualizados():
+    # True se os dados mudaram desde o último rerun desta sessão
+    versao = versao_dados()
+    anterior = st.session_state.get('versao_dados')
+    st.session_state['versao_dados'] = versao
+    return anterior is not None and anterior != versao
+
+
+def botao_atualizar():
+    # Controle manual na sidebar para buscar os dados novamente sem esperar o TTL
+    if st.sidebar.button('Atualizar dados'):
+        limpa_cache()
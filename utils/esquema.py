@@ -0,0 +1,92 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.instrumentacao import anota, medido
+
+# Tipos compactos para as colunas do dataframe de produtos.
+# Os textos que se repetem em todas as linhas viram categorias (cada linha guarda só um código inteiro)
+# e as notas/parcelas, que são números pequenos, passam a ocupar 1 byte em vez de 8.
+# Assim os groupby e isin das páginas trabalham com códigos inteiros e o dataframe ocupa bem menos memória.
+
+logger = logging.getLogger(__name__)
+
+# Colunas do dataframe de produtos, na ordem em que vêm da API
+colunas = ['Produto', 'Categoria do Produto', 'Preço', 'Frete', 'Data da Compra', 'Vendedor', 'Local da compra',
+           'Avaliação da compra', 'Tipo de pagamento', 'Quantidade de parcelas', 'lat', 'lon']
+
+esquema = {
+    'Produto': 'category',
+    'Categoria do Produto': 'category',
+    'Vendedor': 'category',
+    'Local da compra': 'category',
+    'Tipo de pagamento': 'category',
+    'Avaliação da compra': 'int8',
+    'Quantidade de parcelas': 'int8',
+}
+
+AMOSTRA_MEMORIA = 10_000    # Linhas usadas para estimar a memória do dataframe antes da tipagem
+
+# Latitude e longitude dependem só do estado, então ficam em uma tabela separada (uma linha por estado)
+colunas_coordenadas = ['lat', 'lon']
+
+
+def memoria_mb(dados):
+    return dados.memory_usage(deep = True).sum() / 1024 ** 2
+
+
+def estima_memoria_mb(dados):
+    # Mede as strings só de uma amostra das linhas e projeta para o dataframe inteiro
+    if len(dados) <= AMOSTRA_MEMORIA:
+        return memoria_mb(dados)
+    return memoria_mb(dados.sample(AMOSTRA_MEMORIA, random_state = 0)) * len(dados) / AMOSTRA_MEMORIA
+
+
+@medido('tipagem')
+def tipa_dados(dados):
+    '''Converte o dataframe tratado para os tipos compactos do esquema.
+
+    Retorna o dataframe de vendas (sem lat/lon) e a tabela de estados, indexada por
+    'Local da compra', com as colunas lat e lon.
+    '''
+    # Medir as colunas de texto antes da tipagem percorre todas as strings: o painel mostra uma estimativa por
+    # amostra e a medida exata só é feita se o log deste módulo estiver no nível INFO
+    detalhado = logger.isEnabledFor(logging.INFO)
+    antes = memoria_mb(dados) if detalhado else estima_memoria_mb(dados)
+
+    estados = dados.drop_duplicates(subset = 'Local da compra').set_index('Local da compra')[colunas_coordenadas]
+    dados = dados.drop(columns = colunas_coordenadas).astype(esquema)
+
+    # Depois da tipagem a medição é barata (as categorias só guardam os códigos) e aparece no painel de tempos
+    depois = anota_memoria(dados, estados, antes)
+    if detalhado:
+        logger.info('Memória do dataframe de produtos: %.1f MB -> %.1f MB (+ %d estados)', antes, depois, len(estados))
+    return dados, estados
+
+
+def anota_memoria(dados, estados, antes = None):
+    # Mostra no painel de tempos a memória ocupada pelo dataframe já tipado (e antes da tipagem, se informada)
+    memoria = memoria_mb(dados)
+    comparacao = f', ~{antes:.1f} MB antes da tipagem' if antes is not None else ''
+    anota('Dados em memória (último carregamento)',
+          f'{memoria:.1f} MB ({len(dados)} linhas, {len(estados)} estados{comparacao})')
+    return memoria
+
+
+def junta_tipados(partes):
+    # Junta dataframes já tipados sem voltar para texto: antes do concat, cada coluna categórica passa a usar
+    # a união (em ordem alfabética) das categorias presentes nas partes, senão o pandas juntaria como object
+    categoricas = [coluna for coluna, tipo in esquema.items() if tipo == 'category']
+    presentes = lambda serie: serie.cat.categories[np.unique(serie.cat.codes[serie.cat.codes >= 0])]
+    categorias = {coluna: pd.Index(sorted(set().union(*(presentes(parte[coluna]) for parte in partes))))
+                  for coluna in categoricas}
+    partes = [parte.assign(**{coluna: parte[coluna].cat.set_categories(categorias[coluna]) for coluna in categoricas})
+              for parte in partes]
+    return pd.concat(partes, ignore_index = True)
+
+
+def adiciona_coordenadas(dados, estados):
+    # Traz de volta as colunas lat e lon a partir da tabela de estados (usado só para exibir/exportar)
+    uf = dados['Local da compra'].astype(str)
+    return dados.assign(lat = uf.map(estados['lat']), lon = uf.map(estados['lon']))
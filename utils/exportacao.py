@@ -0,0 +1,109 @@
+import gzip
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from utils.instrumentacao import etapa
+
+# Exportação da tabela filtrada para download.
+# Os arquivos são gerados em blocos de linhas direto para o disco (o arquivo inteiro nunca é montado em memória)
+# e guardados em um cache indexado pelos filtros escolhidos, e não pelo conteúdo do dataframe,
+# então nada precisa ser "hasheado" a cada rerun. O cache tem um limite de tamanho em disco: quando
+# ele é ultrapassado, os arquivos usados há mais tempo são apagados.
+
+formatos = {
+    # nome: (extensão, tipo do arquivo)
+    'CSV': ('.csv', 'text/csv'),
+    'CSV compactado (gzip)': ('.csv.gz', 'application/gzip'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+LINHAS_POR_BLOCO = 50_000               # Quantidade de linhas convertidas de cada vez
+MAX_BYTES_CACHE = 512 * 1024 ** 2       # Tamanho máximo dos arquivos guardados no cache
+
+
+@st.cache_resource
+def _cache():
+    return {
+        'pasta': tempfile.mkdtemp(prefix = 'exportacao-'),
+        'arquivos': OrderedDict(),      # {chave: {'caminho', 'tamanho', 'origem'}}, do menos para o mais usado
+        'bytes': 0,
+        'trava': threading.Lock(),
+    }
+
+
+def _escreve_csv(recorte, arquivo):
+    for inicio, bloco in recorte.blocos(LINHAS_POR_BLOCO):
+        arquivo.write(bloco.to_csv(index = False, header = inicio == 0).encode('utf-8'))     # index = False para não salvar o index do dataframe no csv
+
+
+def _escreve_parquet(recorte, arquivo):
+    blocos = recorte.blocos(LINHAS_POR_BLOCO)
+    _, primeiro = next(blocos)      # Sempre existe pelo menos um bloco
+    schema = pa.Schema.from_pandas(primeiro, preserve_index = False)
+    with pq.ParquetWriter(arquivo, schema) as escritor:
+        escritor.write_table(pa.Table.from_pandas(primeiro, schema = schema, preserve_index = False))
+        for _, bloco in blocos:
+            escritor.write_table(pa.Table.from_pandas(bloco, schema = schema, preserve_index = False))
+
+
+def _gera_arquivo(recorte, formato, caminho):
+    with open(caminho, 'wb') as arquivo:
+        if formato == 'Parquet':
+            _escreve_parquet(recorte, arquivo)
+        elif formato == 'CSV compactado (gzip)':
+            with gzip.GzipFile(fileobj = arquivo, mode = 'wb') as compactado:
+                _escreve_csv(recorte, compactado)
+        else:
+            _escreve_csv(recorte, arquivo)
+
+
+def chave_exportacao(filtros, colunas, formato):
+    # Chave do cache: os valores de cada filtro, as colunas escolhidas e o formato
+    return (tuple((coluna, tuple(valor)) for coluna, valor in filtros.items()), tuple(colunas), formato)
+
+
+def abre_exportacao(recorte, chave):
+    '''Retorna o arquivo (aberto para leitura) com o recorte no formato da chave.
+
+    Se o dataframe de onde o recorte foi tirado mudar (os dados foram atualizados),
+    o arquivo guardado para a mesma chave deixa de valer.
+    '''
+    origem = recorte.dados
+    cache = _cache()
+    with cache['trava']:
+        guardado = cache['arquivos'].get(chave)
+        if guardado is not None and guardado['origem']() is origem:
+            cache['arquivos'].move_to_end(chave)
+            return open(guardado['caminho'], 'rb')
+
+    caminho = os.path.join(cache['pasta'], f'{os.urandom(8).hex()}{formatos[chave[-1]][0]}')
+    with etapa('exportação'):
+        _gera_arquivo(recorte, chave[-1], caminho)
+
+    with cache['trava']:
+        if chave in cache['arquivos']:
+            _remove(cache, chave)
+        cache['arquivos'][chave] = {'caminho': caminho, 'tamanho': os.path.getsize(caminho), 'origem': weakref.ref(origem)}
+        cache['bytes'] += cache['arquivos'][chave]['tamanho']
+
+        # O arquivo é aberto antes de liberar espaço, então nunca é apagado antes de ser lido
+        arquivo = open(caminho, 'rb')
+        while cache['bytes'] > MAX_BYTES_CACHE and len(cache['arquivos']) > 1:
+            _remove(cache, next(iter(cache['arquivos'])))
+    return arquivo
+
+
+def _remove(cache, chave):
+    guardado = cache['arquivos'].pop(chave)
+    cache['bytes'] -= guardado['tamanho']
+    try:
+        os.remove(guardado['caminho'])
+    except OSError:
+        pass    # No Windows um arquivo aberto por outra sessão não pode ser apagado; ele fica na pasta temporária
@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.carregamento import ao_atualizar_dados
+from utils.instrumentacao import etapa
+
+# Motor de filtros da página "Dados brutos".
+# Em vez de montar e executar uma query sobre todas as linhas a cada rerun, pré-calculamos o que cada filtro precisa:
+# - colunas categóricas: nada por linha, os próprios códigos da categoria servem de índice (a máscara é uma
+#   tabela booleana por categoria, consultada com os códigos);
+# - colunas de intervalo: as posições das linhas ordenadas pelo valor da coluna (em int32), menos nas colunas
+#   de 1 byte (notas e parcelas), em que comparar os valores direto já é barato.
+# Cada filtro (cláusula) vira uma máscara booleana, guardada em cache; filtros que selecionam tudo são ignorados.
+# Assim, mudar um widget só recalcula a máscara daquela cláusula e o "e" entre as máscaras.
+
+colunas_categoricas = ['Produto', 'Categoria do Produto', 'Vendedor', 'Local da compra', 'Tipo de pagamento']
+colunas_intervalo = ['Preço', 'Frete', 'Data da Compra', 'Avaliação da compra', 'Quantidade de parcelas']
+
+MAX_BYTES_MASCARAS = 32 * 1024 ** 2     # Espaço máximo das máscaras guardadas em cache (as usadas há mais tempo são descartadas)
+
+
+class MotorFiltros:
+    def __init__(self, dados):
+        self.linhas = len(dados)
+        self._categorias = {}
+        self._codigos = {}
+        self._presentes = {}
+        self._valores = {}
+        self._ordem = {}
+        self._ordenados = {}
+        self._mascaras = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+        tipo = np.int32 if len(dados) < 2 ** 31 else np.int64
+
+        for coluna in colunas_categoricas:
+            codigos = dados[coluna].cat.codes.to_numpy()
+            self._categorias[coluna] = dados[coluna].cat.categories
+            self._codigos[coluna] = codigos
+            self._presentes[coluna] = set(np.flatnonzero(np.bincount(codigos[codigos >= 0], minlength = len(self._categorias[coluna]))))
+
+        for coluna in colunas_intervalo:
+            valores = dados[coluna].to_numpy()
+            if valores.dtype.itemsize == 1:
+                self._valores[coluna] = valores
+                continue
+            ordem = np.argsort(valores, kind = 'stable').astype(tipo, copy = False)
+            self._ordem[coluna] = ordem
+            self._ordenados[coluna] = valores[ordem]
+
+    def _mascara_categorica(self, coluna, selecionados):
+        codigos = set(self._categorias[coluna].get_indexer(list(selecionados))) - {-1}
+        if self._presentes[coluna] <= codigos:
+            return None     # Todos os valores que existem nos dados estão selecionados
+
+        # Uma posição por categoria; a última fica False e é a que o código -1 (valor vazio) consulta
+        tabela = np.zeros(len(self._categorias[coluna]) + 1, dtype = bool)
+        tabela[list(codigos)] = True
+        return tabela[self._codigos[coluna]]
+
+    def _mascara_valores(self, coluna, minimo, maximo):
+        # Colunas de 1 byte: compara os valores direto
+        valores = self._valores[coluna]
+        if not len(valores) or (minimo <= valores.min() and (maximo is None or maximo >= valores.max())):
+            return None
+        mascara = valores >= minimo
+        if maximo is not None:
+            mascara &= valores <= maximo
+        return mascara
+
+    def _mascara_intervalo(self, coluna, intervalo):
+        minimo = intervalo[0]
+        maximo = intervalo[1] if len(intervalo) > 1 else None     # O date_input devolve só o início enquanto o usuário escolhe o fim
+        if coluna in self._valores:
+            return self._mascara_valores(coluna, minimo, maximo)
+
+        ordenados = self._ordenados[coluna]
+        if not len(ordenados):
+            return None
+        if coluna == 'Data da Compra':
+            minimo = pd.Timestamp(minimo).to_datetime64()
+            maximo = pd.Timestamp(maximo).to_datetime64() if maximo is not None else None
+
+        inicio = np.searchsorted(ordenados, minimo, side = 'left')
+        fim = np.searchsorted(ordenados, maximo, side = 'right') if maximo is not None else len(ordenados)
+        if inicio == 0 and fim == len(ordenados):
+            return None     # O intervalo cobre todos os valores
+
+        ordem = self._ordem[coluna]
+        if fim - inicio <= len(ordenados) - (fim - inicio):
+            mascara = np.zeros(self.linhas, dtype = bool)
+            mascara[ordem[inicio:fim]] = True
+        else:
+            mascara = np.ones(self.linhas, dtype = bool)
+            mascara[ordem[:inicio]] = False
+            mascara[ordem[fim:]] = False
+        return mascara
+
+    def mascara(self, coluna, valor):
+        '''Máscara booleana das linhas que passam no filtro da coluna, ou None se o filtro seleciona tudo.'''
+        chave = (coluna, tuple(valor))
+        with self._trava:
+            if chave in self._mascaras:
+                self._mascaras.move_to_end(chave)
+                return self._mascaras[chave]
+
+        if coluna in self._codigos:
+            mascara = self._mascara_categorica(coluna, valor)
+        else:
+            mascara = self._mascara_intervalo(coluna, valor)
+
+        with self._trava:
+            if chave not in self._mascaras:
+                self._mascaras[chave] = mascara
+                self._bytes += _tamanho(mascara)
+            while self._bytes > MAX_BYTES_MASCARAS and len(self._mascaras) > 1:
+                _, antiga = self._mascaras.popitem(last = False)
+                self._bytes -= _tamanho(antiga)
+        return mascara
+
+    def filtra(self, filtros):
+        '''Combina os filtros {coluna: valores ou (mínimo, máximo)} e retorna a máscara final (None se nada for filtrado).'''
+        mascaras = [mascara for mascara in (self.mascara(coluna, valor) for coluna, valor in filtros.items()) if mascara is not None]
+        if not mascaras:
+            return None
+        return np.logical_and.reduce(mascaras) if len(mascaras) > 1 else mascaras[0]
+
+
+def _tamanho(mascara):
+    return 0 if mascara is None else mascara.nbytes
+
+
+@st.cache_resource
+def _motores():
+    # Motores já montados: {chave: (dataframe de origem, motor)}
+    return {'motores': {}, 'trava': threading.Lock()}
+
+
+@ao_atualizar_dados
+def _limpa_motores():
+    # Dados novos: os índices antigos (e os dataframes de origem que eles referenciam) são descartados
+    memoria = _motores()
+    with memoria['trava']:
+        memoria['motores'].clear()
+
+
+def motor_filtros(dados, chave = ('', '')):
+    # Monta o motor uma vez por conjunto de dados (e de novo quando os dados forem atualizados)
+    memoria = _motores()
+    with memoria['trava']:
+        guardado = memoria['motores'].get(chave)
+        if guardado is None or guardado[0] is not dados:
+            with etapa('índices dos filtros'):
+                guardado = (dados, MotorFiltros(dados))
+            memoria['motores'][chave] = guardado
+    return guardado[1]
+
+
+def mascara_filtros(dados, filtros, chave = ('', '')):
+    # Máscara das linhas de dados que passam nos filtros (None se nenhum filtro restringe os dados)
+    motor = motor_filtros(dados, chave)
+    with etapa('filtros'):
+        return motor.filtra(filtros)
@@ -0,0 +1,165 @@
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils.instrumentacao import etapa, medido
+from utils.regioes import tabela_estados
+
+# Funções que constroem os gráficos do Dashboard.
+# Cada gráfico fica em cache, indexado pelo conteúdo da tabela agregada que ele desenha: enquanto a tabela não
+# mudar, o mesmo gráfico é reaproveitado entre os reruns (e entre as abas) sem ser montado de novo.
+#
+# Antes de ir para o cache, o gráfico passa por um enxugamento: saem os campos que o plotly express preenche
+# mas que nada usa (como as colunas escondidas do hover) e os números são arredondados, o que deixa o json
+# enviado ao navegador a cada rerun bem menor.
+
+MAX_GRAFICOS = 128      # Quantidade de gráficos guardados em cache
+CASAS_DECIMAIS = 2      # Casas decimais mantidas nos valores (e nas coordenadas) enviados ao navegador
+
+# Campos dos traços que guardam os valores desenhados (os que são arredondados)
+campos_numericos = ['x', 'y', 'lat', 'lon']
+
+# Campos que o plotly express sempre preenche, mas que aqui ficam com o valor padrão do plotly
+campos_padrao = {'legendgroup': '', 'offsetgroup': ''}
+
+
+@st.cache_resource
+def _graficos():
+    # Gráficos já enxutos: {chave: figura}, do menos para o mais usado
+    return {'graficos': OrderedDict(), 'trava': threading.Lock()}
+
+
+def _impressao(tabela):
+    # Identifica o conteúdo de uma tabela agregada (poucas linhas) sem passar pelo hash de argumentos do streamlit
+    nomes = (tabela.name,) if isinstance(tabela, pd.Series) else tuple(tabela.columns)
+    return nomes, pd.util.hash_pandas_object(tabela).to_numpy().tobytes()
+
+
+def _arredonda(valores):
+    if isinstance(valores, np.ndarray) and valores.dtype.kind == 'f':
+        return valores.round(CASAS_DECIMAIS)
+    return valores
+
+
+def enxuga(fig):
+    '''Retorna uma cópia do gráfico só com o que é desenhado, com os números arredondados.
+
+    Remove o customdata que o hovertemplate não usa e os campos que ficariam com o valor padrão.
+    '''
+    figura = fig.to_dict()
+    for traco in figura['data']:
+        if 'customdata' in traco and 'customdata' not in traco.get('hovertemplate', ''):
+            del traco['customdata']
+        for campo, padrao in campos_padrao.items():
+            if traco.get(campo) == padrao:
+                del traco[campo]
+        for campo in campos_numericos:
+            if campo in traco:
+                traco[campo] = _arredonda(traco[campo])
+        if 'size' in traco.get('marker', {}):
+            traco['marker']['size'] = _arredonda(traco['marker']['size'])
+    return go.Figure(figura)
+
+
+def grafico_enxuto(funcao):
+    # Substitui o st.cache_resource nas funções dos gráficos: a chave é o conteúdo da tabela (primeiro argumento)
+    # e os demais argumentos, e o que fica guardado já é o gráfico enxuto
+    @functools.wraps(funcao)
+    def envoltorio(tabela, *argumentos):
+        chave = (funcao.__name__, _impressao(tabela), argumentos)
+        memoria = _graficos()
+        with memoria['trava']:
+            fig = memoria['graficos'].get(chave)
+            if fig is not None:
+                memoria['graficos'].move_to_end(chave)
+                return fig
+
+        fig = enxuga(funcao(tabela, *argumentos))
+
+        with memoria['trava']:
+            memoria['graficos'][chave] = fig
+            while len(memoria['graficos']) > MAX_GRAFICOS:
+                memoria['graficos'].popitem(last = False)
+        return fig
+
+    return envoltorio
+
+
+@medido('montagem dos gráficos')
+@grafico_enxuto
+def mapa_estados(tabela, coluna, titulo):
+    ## Gráfico de mapa, com o valor da coluna por estado no formato de bolhas
+    # A tabela vem indexada por 'Local da compra'; a posição de cada estado vem da tabela fixa de estados
+    tabela = tabela_estados.join(tabela[[coluna]], how = 'inner').reset_index()
+    return px.scatter_geo(tabela,
+                            lat = 'lat',                             # Latitude
+                            lon = 'lon',                             # Longitude
+                            scope = 'south america',                 # Localização do mapa
+                            size = coluna,                           # Tamanho da bolha baseado no valor da coluna (receita ou vendas)
+                            template = 'seaborn',                    # Template do gráfico
+                            hover_name = 'Local da compra',          # Nome que aparece ao passar o mouse
+                            hover_data = {'lat':False,'lon':False},  # Não mostra a latitude e longitude ao passar o mouse
+                            title = titulo)                          # Título do gráfico
+
+
+@medido('montagem dos gráficos')
+@grafico_enxuto
+def linha_mensal(tabela, coluna, titulo, titulo_y):
+    ## Gráfico de linha, com o valor da coluna mês a mês
+    fig = px.line(tabela,
+                    x = 'Mês',                                  # Eixo X
+                    y = coluna,                                 # Eixo Y
+                    markers = True,                             # Mostra os pontos nos meses
+                    range_y = (0, tabela[coluna].max()),        # Define o intervalo do eixo Y, começando em 0 e indo até o valor máximo
+                    color = 'Ano',                              # Define que a cor será alterada com base na informação do ano
+                    line_dash = 'Ano',                          # Define que a linha será tracejada com base na informação do ano
+                    title = titulo)                             # Título do gráfico
+    fig.update_layout(yaxis_title = titulo_y)                   # Alterando Título do eixo Y
+    return fig
+
+
+@medido('montagem dos gráficos')
+@grafico_enxuto
+def barras_estados(tabela, coluna, titulo_y):
+    ## Gráfico de barras, com os 5 primeiros estados da tabela (que já vem ordenada e indexada por 'Local da compra')
+    fig = px.bar(tabela.head().reset_index(),
+                    x = 'Local da compra',                      # Eixo X
+                    y = coluna,                                 # Eixo Y
+                    text_auto = True,                           # Mostra o valor acima de cada barra
+                    title = 'Top estados')                      # Título do gráfico
+    fig.update_layout(yaxis_title = titulo_y)
+    return fig
+
+
+@medido('montagem dos gráficos')
+@grafico_enxuto
+def barras_categorias(tabela, titulo, titulo_y):
+    ## Gráfico de barras por categoria
+    fig = px.bar(tabela,                            # Como a tabela só possui duas colunas, não precisamos definir o eixo X e y
+                    text_auto = True,
+                    title = titulo)
+    fig.update_layout(yaxis_title = titulo_y)
+    return fig
+
+
+@medido('montagem dos gráficos')
+@grafico_enxuto
+def barras_vendedores(ranking, titulo):
+    ## Gráfico de barras horizontais com os primeiros vendedores do ranking (uma série já ordenada)
+    return px.bar(ranking.to_frame(),
+                    x = ranking.name,
+                    y = ranking.index,                          # Pegando o nome dos vendedores
+                    text_auto = True,
+                    title = titulo)
+
+
+def mostra_grafico(fig):
+    # Envia o gráfico (já enxuto) para o navegador; o use_container_width = True faz com que o gráfico ocupe toda a largura da coluna
+    with etapa('envio dos gráficos'):
+        st.plotly_chart(fig, use_container_width = True)
@@ -0,0 +1,174 @@
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Medição leve de cada rerun: cada etapa (download, leitura do json, conversão das datas, agregações,
+# montagem e envio dos gráficos, tabela...) vira um "span" com o tempo gasto e a variação de memória do processo.
+# Os tempos são acumulados em janelas por etapa (percentis p50/p95/p99), podem ser vistos em um painel
+# opcional na sidebar e são gravados como logs em json (um por rerun).
+#
+# Para gravar os logs em um arquivo, defina a variável de ambiente PRODUTOS_LOG_METRICAS com o caminho do arquivo.
+
+logger = logging.getLogger(__name__)
+
+JANELA = 500    # Quantidade de medições guardadas por etapa para calcular os percentis
+
+_atual = threading.local()      # Spans do rerun em andamento (cada sessão roda o script na sua própria thread)
+
+
+# Memória residente do processo. A forma de ler é escolhida uma vez, na importação do módulo:
+# o psutil, se estiver instalado; no Linux, direto do /proc; se nenhum dos dois existir, a memória não é medida
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+if psutil is not None:
+    _processo = psutil.Process()
+
+    def _memoria_mb():
+        return _processo.memory_info().rss / 1024 ** 2
+
+elif os.path.exists('/proc/self/statm'):
+    _tamanho_pagina = os.sysconf('SC_PAGE_SIZE')
+
+    def _memoria_mb():
+        try:
+            with open('/proc/self/statm') as arquivo:
+                return int(arquivo.read().split()[1]) * _tamanho_pagina / 1024 ** 2
+        except (OSError, ValueError):
+            return None
+
+else:
+    def _memoria_mb():
+        return None
+
+
+@st.cache_resource
+def _historico():
+    # Janelas de tempos por (página, etapa), compartilhadas por todas as sessões do processo
+    caminho = os.environ.get('PRODUTOS_LOG_METRICAS')
+    # Se o cache for limpo (st.cache_resource.clear()), o arquivo não ganha um segundo manipulador
+    if caminho and not any(getattr(manipulador, 'baseFilename', None) == os.path.abspath(caminho) for manipulador in logger.handlers):
+        manipulador = logging.FileHandler(caminho, encoding = 'utf-8')
+        manipulador.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(manipulador)
+        logger.setLevel(logging.INFO)
+    return {'tempos': defaultdict(lambda: deque(maxlen = JANELA)), 'notas': {}, 'trava': threading.Lock()}
+
+
+def inicia_rerun(pagina):
+    # Chamado no começo do script de cada página
+    _atual.pagina = pagina
+    _atual.inicio = time.perf_counter()
+    _atual.spans = deque(maxlen = 200)
+
+
+@contextmanager
+def etapa(nome):
+    '''Mede o bloco como um span do rerun atual (tempo e variação de memória).'''
+    memoria_antes = _memoria_mb()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        memoria_depois = _memoria_mb()
+        spans = getattr(_atual, 'spans', None)
+        if spans is not None:
+            variacao = None if memoria_antes is None or memoria_depois is None else memoria_depois - memoria_antes
+            spans.append((nome, duracao, variacao))
+
+
+def registra_etapa(nome, duracao):
+    # Registra um span já medido em outra thread (por exemplo, a leitura do json nas threads do download)
+    spans = getattr(_atual, 'spans', None)
+    if spans is not None:
+        spans.append((nome, duracao, None))
+
+
+def medido(nome):
+    # Versão decorador de etapa, para medir todas as chamadas de uma função
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with etapa(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+def anota(nome, valor):
+    # Guarda uma informação do processo (por exemplo, o tamanho dos dados em memória) para o painel de tempos
+    historico = _historico()
+    with historico['trava']:
+        historico['notas'][nome] = valor
+
+
+def _resumo_spans(spans):
+    # Soma os spans de mesmo nome (por exemplo, todos os gráficos montados no rerun)
+    resumo = {}
+    for nome, duracao, variacao in spans:
+        tempo, memoria = resumo.get(nome, (0.0, None))
+        if variacao is not None:
+            memoria = (memoria or 0.0) + variacao
+        resumo[nome] = (tempo + duracao, memoria)
+    return resumo
+
+
+def finaliza_rerun():
+    # Chamado no fim do script: guarda os tempos nas janelas e grava o log em json do rerun
+    if getattr(_atual, 'spans', None) is None:
+        return
+    total = time.perf_counter() - _atual.inicio
+    resumo = _resumo_spans(_atual.spans)
+
+    historico = _historico()
+    with historico['trava']:
+        for nome, (tempo, _) in resumo.items():
+            historico['tempos'][(_atual.pagina, nome)].append(tempo)
+        historico['tempos'][(_atual.pagina, 'total')].append(total)
+
+    logger.info(json.dumps({
+        'data': datetime.datetime.now().isoformat(timespec = 'milliseconds'),
+        'pagina': _atual.pagina,
+        'total_ms': round(total * 1000, 2),
+        'etapas': [{'nome': nome, 'ms': round(tempo * 1000, 2), 'memoria_mb': None if memoria is None else round(memoria, 2)}
+                   for nome, (tempo, memoria) in resumo.items()],
+    }, ensure_ascii = False))
+    _atual.ultimo = resumo, total
+    _atual.spans = None
+
+
+def painel_debug():
+    # Painel opcional na sidebar com as etapas do último rerun e os percentis das últimas medições
+    if not st.sidebar.checkbox('Mostrar tempos de execução', key = 'painel_debug'):
+        return
+    ultimo, total = getattr(_atual, 'ultimo', ({}, 0.0))
+    pagina = getattr(_atual, 'pagina', '')
+
+    historico = _historico()
+    with historico['trava']:
+        janelas = {nome: np.array(tempos) for (pagina_janela, nome), tempos in historico['tempos'].items() if pagina_janela == pagina}
+        notas = dict(historico['notas'])
+
+    linhas = []
+    for nome, tempos in janelas.items():
+        tempo, memoria = ultimo.get(nome, (total if nome == 'total' else None, None))
+        p50, p95, p99 = np.percentile(tempos, [50, 95, 99]) * 1000
+        linhas.append({'Etapa': nome, 'Último (ms)': None if tempo is None else tempo * 1000, 'Δ memória (MB)': memoria,
+                       'p50 (ms)': p50, 'p95 (ms)': p95, 'p99 (ms)': p99, 'Medições': len(tempos)})
+
+    st.sidebar.dataframe(pd.DataFrame(linhas).round(1), hide_index = True)
+    for nome, valor in notas.items():
+        st.sidebar.caption(f'{nome}: {valor}')
@@ -0,0 +1,185 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.esquema import adiciona_coordenadas, colunas_coordenadas
+
+# Recorte: uma "visão" de um dataframe compartilhado entre as sessões.
+# Em vez de copiar as linhas filtradas, cada sessão guarda só as posições dessas linhas e as colunas escolhidas.
+# As linhas só são copiadas no momento de exibir uma página da tabela ou de gerar um bloco da exportação.
+#
+# Ordenar um recorte não ordena as linhas de novo a cada rerun: a ordenação do dataframe inteiro por uma coluna
+# fica em cache (uma por dataframe, coluna e sentido), e o recorte só separa dela as suas linhas.
+# Quando só as primeiras linhas interessam (o rodapé do Dashboard), elas são escolhidas com argpartition.
+
+MAX_ORDENS = 8      # Quantidade de ordenações completas guardadas em cache (as usadas há mais tempo são descartadas)
+
+
+@st.cache_resource
+def _ordens():
+    # {(id do dataframe, coluna, crescente): (referência fraca ao dataframe, posições ordenadas)}, do menos para o mais usado
+    return {'ordens': OrderedDict(), 'trava': threading.Lock()}
+
+
+def _descarta_ordens(ordens, identificador):
+    # Chamada quando o dataframe deixa de existir (os dados foram atualizados): as ordenações dele saem do cache
+    with ordens['trava']:
+        for chave in [chave for chave in ordens['ordens'] if chave[0] == identificador]:
+            del ordens['ordens'][chave]
+
+
+def _ordem_completa(recorte, coluna, crescente):
+    # Posições de todas as linhas do dataframe do recorte, na ordem (estável) da coluna
+    dados = recorte.dados
+    chave = (id(dados), coluna, crescente)
+    ordens = _ordens()
+    with ordens['trava']:
+        guardado = ordens['ordens'].get(chave)
+        if guardado is not None and guardado[0]() is dados:
+            ordens['ordens'].move_to_end(chave)
+            return guardado[1]
+
+    serie = Recorte(dados, None, estados = recorte.estados).coluna(coluna)
+    ordem = serie.sort_values(ascending = crescente, kind = 'stable').index.to_numpy()
+    ordem = ordem.astype(np.int32 if len(dados) < 2 ** 31 else np.int64, copy = False)
+
+    with ordens['trava']:
+        if not any(existente[0] == id(dados) for existente in ordens['ordens']):
+            weakref.finalize(dados, _descarta_ordens, ordens, id(dados))
+        ordens['ordens'][chave] = (weakref.ref(dados), ordem)
+        while len(ordens['ordens']) > MAX_ORDENS:
+            ordens['ordens'].popitem(last = False)
+    return ordem
+
+
+def _chave_ordenacao(serie, crescente):
+    # Valores numéricos que ordenam do mesmo jeito que a coluna no sentido pedido, com os vazios no fim
+    # (como no sort_values). None se a coluna não for numérica, de data ou categórica
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        valores, vazios = serie.cat.codes.to_numpy().astype(np.int64), serie.isna().to_numpy()
+    elif pd.api.types.is_datetime64_dtype(serie.dtype):
+        valores, vazios = serie.to_numpy().view(np.int64), serie.isna().to_numpy()
+    elif pd.api.types.is_integer_dtype(serie.dtype):
+        valores, vazios = serie.to_numpy().astype(np.int64), np.zeros(len(serie), dtype = bool)
+    elif pd.api.types.is_float_dtype(serie.dtype):
+        valores = serie.to_numpy().astype(np.float64)
+        vazios = np.isnan(valores)
+    else:
+        return None
+
+    if not crescente:
+        valores = -valores
+    if vazios.any():
+        valores = valores.copy()
+        valores[vazios] = valores[~vazios].max() + 1 if not vazios.all() else 0
+    return valores
+
+
+def _primeiras(chave, limite):
+    # Posições das primeiras linhas (limite) da ordenação estável pela chave, sem ordenar todas as linhas
+    corte = chave[np.argpartition(chave, limite - 1)[limite - 1]]
+    menores = np.flatnonzero(chave < corte)
+    empatadas = np.flatnonzero(chave == corte)[:limite - len(menores)]
+    candidatas = np.concatenate([menores, empatadas])
+    return candidatas[np.argsort(chave[candidatas], kind = 'stable')]
+
+
+class Recorte:
+    def __init__(self, dados, posicoes = None, colunas = None, estados = None):
+        '''dados: dataframe compartilhado (não é alterado).
+        posicoes: posições das linhas do recorte, na ordem em que devem aparecer (None = todas).
+        colunas: colunas do recorte; lat e lon podem ser pedidas se a tabela de estados for informada.
+        '''
+        self.dados = dados
+        self.posicoes = posicoes
+        self.colunas = list(dados.columns) if colunas is None else list(colunas)
+        self.estados = estados
+
+    @classmethod
+    def da_mascara(cls, dados, mascara, **opcoes):
+        # Guarda as posições em int32 sempre que possível (metade da memória de int64)
+        if mascara is None:
+            return cls(dados, **opcoes)
+        tipo = np.int32 if len(dados) < 2 ** 31 else np.int64
+        return cls(dados, np.flatnonzero(mascara).astype(tipo, copy = False), **opcoes)
+
+    def __len__(self):
+        return len(self.dados) if self.posicoes is None else len(self.posicoes)
+
+    @property
+    def shape(self):
+        return len(self), len(self.colunas)
+
+    def coluna(self, coluna):
+        # Valores da coluna nas linhas do recorte (lat e lon vêm da tabela de estados)
+        if coluna in colunas_coordenadas and coluna not in self.dados.columns:
+            serie = self.coluna('Local da compra').astype(str).map(self.estados[coluna])
+        else:
+            serie = self.dados[coluna]
+            serie = serie if self.posicoes is None else serie.iloc[self.posicoes]
+        return serie.reset_index(drop = True)
+
+    def onde(self, mascara):
+        # Novo recorte só com as linhas em que a máscara (uma posição por linha do recorte) é verdadeira
+        posicoes = np.flatnonzero(mascara)
+        if self.posicoes is not None:
+            posicoes = self.posicoes[posicoes]
+        elif len(self.dados) < 2 ** 31:
+            posicoes = posicoes.astype(np.int32)
+        return Recorte(self.dados, posicoes, self.colunas, self.estados)
+
+    def linhas(self, colunas):
+        # Copia as linhas do recorte com as colunas informadas (para cálculos que precisam de um dataframe)
+        if self.posicoes is None:
+            return self.dados[colunas]
+        return self.dados.iloc[self.posicoes, [self.dados.columns.get_loc(coluna) for coluna in colunas]]
+
+    def ordena(self, coluna, crescente = True, limite = None):
+        '''Novo recorte com as mesmas linhas ordenadas pela coluna (só as posições são reordenadas).
+
+        Se limite for informado, o novo recorte fica só com as primeiras limite linhas da ordenação.
+        '''
+        if limite is not None and limite < len(self):
+            chave = _chave_ordenacao(self.coluna(coluna), crescente)
+            if chave is not None:
+                ordem = _primeiras(chave, limite) if limite > 0 else np.arange(0)
+                return Recorte(self.dados, ordem if self.posicoes is None else self.posicoes[ordem], self.colunas, self.estados)
+
+        if self.posicoes is None:
+            posicoes = _ordem_completa(self, coluna, crescente)
+        elif len(self.posicoes) < 2 or np.all(self.posicoes[1:] > self.posicoes[:-1]):
+            # As linhas do recorte estão na ordem do dataframe: basta separar as delas na ordenação completa
+            presentes = np.zeros(len(self.dados), dtype = bool)
+            presentes[self.posicoes] = True
+            ordem = _ordem_completa(self, coluna, crescente)
+            posicoes = ordem[presentes[ordem]]
+        else:
+            ordem = self.coluna(coluna).sort_values(ascending = crescente, kind = 'stable').index.to_numpy()
+            posicoes = self.posicoes[ordem]
+
+        if limite is not None:
+            posicoes = posicoes[:limite]
+        return Recorte(self.dados, posicoes, self.colunas, self.estados)
+
+    def fatia(self, inicio, fim):
+        # Copia só as linhas [inicio, fim) do recorte, já com as colunas escolhidas
+        base = [coluna for coluna in self.dados.columns if coluna in self.colunas]
+        virtuais = [coluna for coluna in self.colunas if coluna not in self.dados.columns]
+        if virtuais and 'Local da compra' not in base:
+            base.append('Local da compra')
+
+        linhas = slice(inicio, fim) if self.posicoes is None else self.posicoes[inicio:fim]
+        trecho = self.dados.iloc[linhas, [self.dados.columns.get_loc(coluna) for coluna in base]]
+        if virtuais:
+            trecho = adiciona_coordenadas(trecho, self.estados)
+        return trecho[self.colunas]
+
+    def blocos(self, tamanho):
+        # Percorre o recorte em blocos de linhas (pelo menos um, para que um recorte vazio ainda tenha as colunas)
+        for inicio in range(0, max(len(self), 1), tamanho):
+            yield inicio, self.fatia(inicio, inicio + tamanho)
+
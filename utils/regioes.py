@@ -0,0 +1,29 @@
+import pandas as pd
+
+# Lista de regiões para o filtro ('Brasil' significa todas)
+regioes = ['Brasil', 'Centro-Oeste', 'Nordeste', 'Norte', 'Sudeste', 'Sul']
+
+# Estados de cada região, usados para filtrar localmente os dados que já temos em memória
+# (as chaves são os nomes em minúsculo, do mesmo jeito que são passados na url da API)
+estados_por_regiao = {
+    'centro-oeste': ['DF', 'GO', 'MS', 'MT'],
+    'nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'norte': ['AC', 'AM', 'AP', 'PA', 'RO', 'RR', 'TO'],
+    'sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'sul': ['PR', 'RS', 'SC'],
+}
+
+# Latitude e longitude (centro aproximado) de cada estado
+coordenadas_estados = {
+    'AC': (-8.77, -70.55), 'AL': (-9.62, -36.82), 'AM': (-3.47, -65.10), 'AP': (1.41, -51.77),
+    'BA': (-13.29, -41.71), 'CE': (-5.20, -39.53), 'DF': (-15.83, -47.86), 'ES': (-19.19, -40.34),
+    'GO': (-15.98, -49.86), 'MA': (-5.42, -45.44), 'MG': (-18.10, -44.38), 'MS': (-20.51, -54.54),
+    'MT': (-12.64, -55.42), 'PA': (-3.79, -52.48), 'PB': (-7.28, -36.72), 'PE': (-8.38, -37.86),
+    'PI': (-6.60, -42.28), 'PR': (-24.89, -51.55), 'RJ': (-22.25, -42.66), 'RN': (-5.81, -36.59),
+    'RO': (-10.83, -63.34), 'RR': (1.99, -61.33), 'RS': (-30.17, -53.50), 'SC': (-27.45, -50.95),
+    'SE': (-10.57, -37.45), 'SP': (-22.19, -48.79), 'TO': (-9.46, -48.26),
+}
+
+# Tabela fixa de estados (índice 'Local da compra', colunas lat e lon), montada uma única vez por processo.
+# Os mapas do Dashboard buscam a posição das bolhas aqui, sem depender das coordenadas que vêm nos dados
+tabela_estados = pd.DataFrame.from_dict(coordenadas_estados, orient = 'index', columns = ['lat', 'lon']).rename_axis('Local da compra')
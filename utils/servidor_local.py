@@ -0,0 +1,97 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.regioes import estados_por_regiao
+
+# Servidor HTTP local que imita a API de produtos (mesmo formato de json e mesmos parâmetros 'regiao' e 'ano').
+# Serve para medir e testar o download sem acesso à internet, inclusive simulando lentidão e falhas.
+#
+# Uso pela linha de comando:
+#   python -m utils.servidor_local produtos.json --porta 8000
+#   PRODUTOS_FONTE=http://127.0.0.1:8000/produtos streamlit run Dashboard.py
+
+
+def _filtra(registros, regiao, ano):
+    estados = set(estados_por_regiao[regiao]) if regiao else None
+    return [registro for registro in registros
+            if (estados is None or registro['Local da compra'] in estados)
+            and (not ano or registro['Data da Compra'].endswith(f'/{ano}'))]
+
+
+def cria_servidor(registros, porta = 0, atraso = 0.0, falhas = 0):
+    '''Cria (sem iniciar) o servidor local com a lista de registros.
+
+    atraso: segundos de espera antes de cada resposta.
+    falhas: quantidade de respostas 503 devolvidas para cada url antes de responder normalmente.
+    '''
+    tentativas = Counter()
+    trava = threading.Lock()
+
+    class Manipulador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with trava:
+                tentativas[self.path] += 1
+                falhar = tentativas[self.path] <= falhas
+            time.sleep(atraso)
+            if falhar:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            parametros = parse_qs(urlparse(self.path).query)
+            regiao = parametros.get('regiao', [''])[0].lower()
+            ano = parametros.get('ano', [''])[0]
+            if regiao and regiao not in estados_por_regiao:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            corpo = json.dumps(_filtra(registros, regiao, ano)).encode('utf-8')
+            etag = '"' + hashlib.md5(corpo).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass    # Sem log a cada requisição
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), Manipulador)
+    servidor.tentativas = tentativas
+    return servidor
+
+
+def inicia_servidor(registros, **opcoes):
+    # Inicia o servidor em uma thread e retorna (url, servidor); use servidor.shutdown() para parar
+    servidor = cria_servidor(registros, **opcoes)
+    threading.Thread(target = servidor.serve_forever, daemon = True).start()
+    return f'http://127.0.0.1:{servidor.server_address[1]}/produtos', servidor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Servidor local que imita a API de produtos')
+    parser.add_argument('arquivo', help = 'arquivo json com a lista de registros (mesmo formato da API)')
+    parser.add_argument('--porta', type = int, default = 8000)
+    parser.add_argument('--atraso', type = float, default = 0.0, help = 'segundos de espera antes de cada resposta')
+    parser.add_argument('--falhas', type = int, default = 0, help = 'respostas 503 por url antes de responder normalmente')
+    argumentos = parser.parse_args()
+
+    with open(argumentos.arquivo, encoding = 'utf-8') as arquivo:
+        registros = json.load(arquivo)
+    servidor = cria_servidor(registros, argumentos.porta, argumentos.atraso, argumentos.falhas)
+    print(f'Servindo {len(registros)} registros em http://127.0.0.1:{servidor.server_address[1]}/produtos')
+    servidor.serve_forever()
@@ -0,0 +1,146 @@
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from utils.esquema import esquema, tipa_dados
+
+# Cópia local dos produtos em formato colunar (Arrow IPC), já com os tipos compactos de utils/esquema.py.
+# O snapshot é uma pasta com uma ou mais partes: a primeira tem a carga completa e cada
+# sincronização grava uma nova parte só com as linhas mais novas, sem reescrever as anteriores.
+# As partes são abertas com memory map, então abrir o snapshot não precisa ler o arquivo inteiro.
+#
+# As colunas categóricas são gravadas como dicionários (cada linha guarda só o código) e as notas/parcelas
+# como int8, então o dataframe aberto já sai tipado, sem recriar as strings nem passar pelo tipa_dados.
+# A latitude e longitude ficam em um arquivo à parte, com uma linha por estado.
+
+ARQUIVO_ESTADOS = 'estados.arrow'
+
+
+def _partes(caminho):
+    return sorted(Path(caminho).glob('parte-*.arrow'))
+
+
+def _grava(tabela, destino):
+    # Grava em um arquivo temporário e renomeia, para que ninguém abra um arquivo pela metade
+    temporario = destino.with_suffix('.tmp')
+    with pa.OSFile(str(temporario), 'wb') as arquivo:
+        with ipc.new_file(arquivo, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    temporario.replace(destino)
+
+
+def _grava_parte(tabela, caminho):
+    pasta = Path(caminho)
+    pasta.mkdir(parents = True, exist_ok = True)
+    _grava(tabela, pasta / f'parte-{len(_partes(pasta)):05d}.arrow')
+
+
+def _tabela(dados):
+    # Converte o dataframe tipado para Arrow. O índice dos dicionários é sempre int32: com o tamanho mínimo
+    # que o pandas usa, uma parte nova com mais categorias não caberia no esquema das partes anteriores
+    tabela = pa.Table.from_pandas(dados, preserve_index = False)
+    campos = [pa.field(campo.name, pa.dictionary(pa.int32(), campo.type.value_type))
+              if pa.types.is_dictionary(campo.type) else campo for campo in tabela.schema]
+    return tabela.cast(pa.schema(campos, metadata = tabela.schema.metadata))
+
+
+def abre_tabela(caminho):
+    # Abre todas as partes com memory map e junta sem copiar os dados
+    tabelas = [ipc.open_file(pa.memory_map(str(parte), 'r')).read_all() for parte in _partes(caminho)]
+    if not tabelas:
+        raise FileNotFoundError(f'Nenhum snapshot encontrado em {caminho}')
+    # Cada parte tem o próprio dicionário; depois de juntar, todas passam a usar o mesmo
+    return pa.concat_tables(tabelas).unify_dictionaries()
+
+
+def _le_estados(caminho):
+    tabela = ipc.open_file(pa.memory_map(str(Path(caminho) / ARQUIVO_ESTADOS), 'r')).read_all()
+    return tabela.to_pandas().set_index('Local da compra')
+
+
+def abre_snapshot(caminho):
+    '''Retorna o dataframe de vendas já tipado e a tabela de estados, como o tipa_dados.'''
+    dados = abre_tabela(caminho).to_pandas(split_blocks = True)
+
+    # As categorias que aparecem só nas partes novas ficam no fim do dicionário unificado; voltam para a ordem
+    # alfabética que o tipa_dados usa (só recalcula os códigos quando alguma sincronização trouxe categorias novas)
+    for coluna in dados.select_dtypes('category'):
+        categorias = dados[coluna].cat.categories
+        if not categorias.is_monotonic_increasing:
+            dados[coluna] = dados[coluna].cat.reorder_categories(categorias.sort_values())
+    return dados, _le_estados(caminho)
+
+
+def versao_snapshot(caminho):
+    # Identifica o conteúdo atual do snapshot pelos arquivos (nome, tamanho e data de modificação), sem lê-los
+    arquivos = _partes(caminho) + [Path(caminho) / ARQUIVO_ESTADOS]
+    return tuple((arquivo.name, arquivo.stat().st_size, arquivo.stat().st_mtime_ns) for arquivo in arquivos if arquivo.exists())
+
+
+def _grava_estados(estados, caminho):
+    pasta = Path(caminho)
+    pasta.mkdir(parents = True, exist_ok = True)
+    _grava(pa.Table.from_pandas(estados.reset_index(), preserve_index = False), pasta / ARQUIVO_ESTADOS)
+
+
+def salva_snapshot(dados, caminho):
+    # Substitui o snapshot inteiro pelo dataframe tratado informado (com lat e lon)
+    dados, estados = tipa_dados(dados)
+    for parte in _partes(caminho):
+        parte.unlink()
+    _grava_estados(estados, caminho)
+    _grava_parte(_tabela(dados), caminho)
+
+
+def _linhas_novas(fonte, gravadas):
+    # Diferença de multiconjuntos: uma linha da fonte é nova se aparece nela mais vezes do que no snapshot
+    colunas = list(fonte.columns)
+    ocorrencia = lambda dados: dados.groupby(colunas, sort = False, dropna = False).cumcount()
+    juntas = fonte.assign(_ocorrencia = ocorrencia(fonte)).merge(
+        gravadas[colunas].assign(_ocorrencia = ocorrencia(gravadas[colunas])),
+        on = colunas + ['_ocorrencia'], how = 'left', indicator = True)
+    return juntas.loc[juntas['_merge'] == 'left_only', colunas]
+
+
+def sincroniza_snapshot(caminho, le_fonte, ano_atual):
+    '''Atualiza o snapshot e devolve quantas linhas novas foram gravadas.
+
+    le_fonte(anos) deve devolver o dataframe já tratado da fonte para os anos pedidos
+    (None significa todos). Na primeira vez o snapshot é criado com a carga completa;
+    depois só as linhas a partir da última 'Data da Compra' já gravada são acrescentadas.
+    '''
+    # Sem snapshot, ou com um snapshot do formato antigo (sem tipos e sem o arquivo de estados): carga completa
+    if not _partes(caminho) or not (Path(caminho) / ARQUIVO_ESTADOS).exists():
+        dados = le_fonte(None)
+        salva_snapshot(dados, caminho)
+        return len(dados)
+
+    tabela = abre_tabela(caminho)
+    ultima_data = pc.max(tabela['Data da Compra']).as_py()
+
+    novos, estados = tipa_dados(le_fonte(list(range(ultima_data.year, ano_atual + 1))))
+
+    # O último dia gravado pode ter recebido vendas depois da última sincronização. A fonte não garante a ordem
+    # das linhas (o download junta as partições região por região), então as linhas desse dia são comparadas
+    # pelo conteúdo com as que já foram gravadas
+    ultimo_dia = pc.equal(tabela['Data da Compra'], pa.scalar(ultima_data, type = tabela['Data da Compra'].type))
+    gravadas = tabela.filter(ultimo_dia).to_pandas()
+    mesmo_dia = _linhas_novas(novos[novos['Data da Compra'] == ultima_data], gravadas)
+    novos = pd.concat([mesmo_dia, novos[novos['Data da Compra'] > ultima_data]])
+    if novos.empty:
+        return 0
+
+    # O merge com as linhas gravadas (categorias diferentes) e o concat podem deixar as colunas categóricas como
+    # texto; o pyarrow 13 não converte texto direto para dicionário, então os tipos do esquema são aplicados de novo
+    novos = novos.astype(esquema)
+
+    # Estados que ainda não estavam no snapshot (a gravação é atômica, então pode vir antes da parte nova)
+    gravados = _le_estados(caminho)
+    if not estados.index.isin(gravados.index).all():
+        _grava_estados(pd.concat([gravados, estados[~estados.index.isin(gravados.index)]]), caminho)
+
+    _grava_parte(_tabela(novos[tabela.schema.names]).cast(tabela.schema), caminho)
+    return len(novos)
@@ -0,0 +1,56 @@
+import math
+
+import streamlit as st
+
+from utils.instrumentacao import etapa
+
+# Tabela paginada: em vez de enviar o dataframe inteiro para o navegador a cada rerun,
+# só as linhas da página atual são enviadas. A ordenação é feita aqui no servidor, antes de cortar a página.
+# A tabela recebe um Recorte (utils/recorte.py), então só as linhas da página são copiadas do dataframe compartilhado.
+
+TAMANHOS_PAGINA = [25, 50, 100, 500]
+
+
+def tabela_paginada(recorte, chave, max_linhas = None):
+    '''Mostra o recorte em páginas e retorna o trecho exibido.
+
+    chave diferencia os widgets de cada tabela na mesma página. Se max_linhas for informado,
+    só as primeiras max_linhas linhas (depois da ordenação) podem ser navegadas.
+    '''
+    coluna1, coluna2, coluna3, coluna4 = st.columns(4)
+
+    with coluna1:
+        ordenar_por = st.selectbox('Ordenar por', ['(sem ordenação)'] + recorte.colunas, key = f'{chave}_ordem')
+    with coluna2:
+        crescente = st.checkbox('Crescente', value = True, key = f'{chave}_crescente')
+    with coluna3:
+        tamanho_pagina = st.selectbox('Linhas por página', TAMANHOS_PAGINA, key = f'{chave}_tamanho')
+
+    total_linhas = len(recorte)
+    linhas_navegaveis = total_linhas if max_linhas is None else min(total_linhas, max_linhas)
+    paginas = max(math.ceil(linhas_navegaveis / tamanho_pagina), 1)
+
+    # Se os filtros diminuírem a tabela, a página guardada pode não existir mais
+    if st.session_state.get(f'{chave}_pagina', 1) > paginas:
+        st.session_state[f'{chave}_pagina'] = paginas
+
+    with coluna4:
+        pagina = st.number_input('Página', 1, paginas, key = f'{chave}_pagina')     # Sem valor padrão: começa no mínimo (1), e a página pode ser ajustada pelo session_state
+
+    if ordenar_por != '(sem ordenação)':
+        # A ordenação completa de cada coluna fica em cache; com max_linhas, só as primeiras linhas são escolhidas
+        with etapa('ordenação da tabela'):
+            recorte = recorte.ordena(ordenar_por, crescente, limite = max_linhas)
+
+    inicio = (pagina - 1) * tamanho_pagina
+    fim = min(inicio + tamanho_pagina, linhas_navegaveis)
+    with etapa('envio da tabela'):
+        trecho = recorte.fatia(inicio, fim)
+        st.dataframe(trecho, use_container_width = True)
+
+    # A contagem de linhas é mostrada à parte, já que a tabela só tem a página atual
+    legenda = f'Linhas {inicio + 1 if fim else 0} a {fim} de {total_linhas} · página {pagina} de {paginas}'
+    if linhas_navegaveis < total_linhas:
+        legenda += f' (limitado às primeiras {linhas_navegaveis} linhas)'
+    st.caption(legenda)
+    return trecho